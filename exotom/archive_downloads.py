@@ -0,0 +1,135 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger(__name__)
+
+
+class ArchiveDownloader:
+    """Downloads files in a pool of threads, which share one requests.Session and thereby its connections.
+
+    Concurrent requests to each host are limited, failed requests are retried with exponential backoff and jitter.
+    Use it as context manager to close its threads and connections afterwards.
+    """
+
+    def __init__(
+        self,
+        headers: dict = None,
+        workers: int = None,
+        max_connections_per_host: int = None,
+        n_attempts: int = None,
+        backoff_in_s: float = None,
+        timeout_in_s: float = None,
+    ):
+        """
+        :param headers: headers sent with each request, e.g. for authorization
+        :param workers: number of threads, defaults to settings.ARCHIVE_DOWNLOADS["workers"]
+        :param max_connections_per_host: defaults to settings.ARCHIVE_DOWNLOADS["max_connections_per_host"]
+        :param n_attempts: defaults to settings.ARCHIVE_DOWNLOADS["n_attempts"]
+        :param backoff_in_s: mean delay before the second attempt, which doubles for each further attempt
+        :param timeout_in_s: timeout for connecting and for each read
+        """
+        config = settings.ARCHIVE_DOWNLOADS
+        self.workers = workers or config["workers"]
+        self.max_connections_per_host = (
+            max_connections_per_host or config["max_connections_per_host"]
+        )
+        self.n_attempts = n_attempts or config["n_attempts"]
+        self.backoff_in_s = (
+            config["backoff_in_s"] if backoff_in_s is None else backoff_in_s
+        )
+        self.timeout_in_s = timeout_in_s or config["timeout_in_s"]
+
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        adapter = HTTPAdapter(pool_maxsize=self.max_connections_per_host)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        self.host_semaphores = {}
+        self.host_semaphores_lock = threading.Lock()
+
+    def __enter__(self) -> "ArchiveDownloader":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def get(self, url: str, n_attempts: int = None) -> bytes:
+        """Downloads url and returns its content. Server and connection errors are retried.
+
+        :raises Exception if all attempts failed or the request failed with a client error
+        """
+        n_attempts = n_attempts or self.n_attempts
+        for attempt in range(n_attempts):
+            try:
+                with self.get_host_semaphore(url):
+                    response = self.session.get(url, timeout=self.timeout_in_s)
+                response.raise_for_status()
+                return response.content
+            except requests.RequestException as e:
+                if attempt == n_attempts - 1 or not self.is_retryable(e):
+                    raise Exception(
+                        f"Couldn't download data from {url} after {attempt + 1} attempts due to '{e}'."
+                    ) from e
+                delay = self.get_backoff_delay(attempt)
+                log.warning(
+                    "Request to %s failed due to '%s', retrying in %.2fs (%d attempts left).",
+                    url,
+                    e,
+                    delay,
+                    n_attempts - attempt - 1,
+                )
+                time.sleep(delay)
+
+    @staticmethod
+    def is_retryable(error: requests.RequestException) -> bool:
+        """Client errors other than too many requests would fail again."""
+        if error.response is None:
+            return True
+        status_code = error.response.status_code
+        return status_code == 429 or status_code >= 500
+
+    def get_backoff_delay(self, attempt: int) -> float:
+        """Returns a random delay around backoff_in_s * 2**attempt, so that failed requests are not retried at once."""
+        return self.backoff_in_s * 2 ** attempt * random.uniform(0.5, 1.5)
+
+    def get_host_semaphore(self, url: str) -> threading.Semaphore:
+        host = urlsplit(url).netloc
+        with self.host_semaphores_lock:
+            if host not in self.host_semaphores:
+                self.host_semaphores[host] = threading.BoundedSemaphore(
+                    self.max_connections_per_host
+                )
+            return self.host_semaphores[host]
+
+    def map(self, function, items):
+        """Calls function with each item in the threads and yields the results in the order of the items.
+
+        At most twice as many items as there are threads are processed ahead of the consumer, so that results are not
+        piling up in memory.
+        """
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(self.executor.submit(function, item))
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
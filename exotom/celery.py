@@ -25,4 +25,9 @@ app.conf.beat_schedule = {
         "task": "exotom.tasks.process_new_observations",
         "schedule": crontab(hour=13, minute=0),
     },
+    # Executes every monday at 12:00
+    "update_iers": {
+        "task": "exotom.tasks.update_iers",
+        "schedule": crontab(hour=12, minute=0, day_of_week=1),
+    },
 }
@@ -0,0 +1,91 @@
+import io
+import logging
+import os
+
+import pandas as pd
+from django.conf import settings
+from django.core.files.base import ContentFile
+from tom_dataproducts.models import DataProduct
+
+try:
+    import pyarrow
+    import pyarrow.feather
+except ImportError:
+    pyarrow = None
+
+log = logging.getLogger(__name__)
+
+# file extension by storage format
+EXTENSIONS = {"feather": ".feather", "parquet": ".parquet", "csv": ".csv"}
+
+# types of data products stored with save_dataframe
+DATAFRAME_DATA_PRODUCT_TYPES = (
+    "image_photometry_catalog",
+    "transit_all_light_curves",
+    "transit_best_light_curves",
+)
+
+
+def get_storage_format() -> str:
+    """Returns settings.DATAFRAME_STORAGE_FORMAT, or csv if pyarrow is not installed."""
+    storage_format = settings.DATAFRAME_STORAGE_FORMAT
+    if storage_format not in EXTENSIONS:
+        raise ValueError(f"Unknown dataframe storage format '{storage_format}'.")
+    if storage_format != "csv" and pyarrow is None:
+        log.warning("pyarrow is not installed, storing %s as csv.", storage_format)
+        return "csv"
+    return storage_format
+
+
+def save_dataframe(
+    dp: DataProduct, df: pd.DataFrame, name: str, storage_format: str = None
+):
+    """Saves a DataFrame as data of a DataProduct.
+
+    Binary formats need string column names and only store an index, which is not just the row number, as column.
+    Like for CSV files, column names are therefore read back as strings.
+
+    :param dp: data product to save DataFrame to
+    :param df: DataFrame
+    :param name: file name without extension
+    :param storage_format: feather, parquet or csv, defaults to get_storage_format()
+    """
+    if storage_format is None:
+        storage_format = get_storage_format()
+
+    if storage_format == "csv":
+        data = df.to_csv().encode()
+    else:
+        df = df.reset_index(drop=df.index.equals(pd.RangeIndex(len(df))))
+        df.columns = df.columns.astype(str)
+        buffer = io.BytesIO()
+        if storage_format == "feather":
+            # uncompressed, so that it can be memory-mapped when reading
+            df.to_feather(buffer, compression="uncompressed")
+        else:
+            df.to_parquet(buffer, index=False)
+        data = buffer.getvalue()
+
+    dp.data.save(name + EXTENSIONS[storage_format], ContentFile(data))
+    dp.save()
+
+
+def read_dataframe(path: str) -> pd.DataFrame:
+    """Reads a DataFrame stored by save_dataframe, with the format given by the file extension.
+
+    Feather files are memory-mapped. CSV files are parsed by pandas' default parser, since pyarrow infers other types,
+    e.g. object columns for columns without any value.
+    """
+    extension = os.path.splitext(path)[1]
+    if extension == EXTENSIONS["feather"]:
+        return pyarrow.feather.read_table(path, memory_map=True).to_pandas()
+    if extension == EXTENSIONS["parquet"]:
+        return pd.read_parquet(path, memory_map=True)
+    return pd.read_csv(path)
+
+
+def dataframe_to_csv(df: pd.DataFrame) -> str:
+    """Returns a DataFrame read by read_dataframe as CSV, with the index column of CSV files as index."""
+    if len(df.columns) > 0 and df.columns[0] == "Unnamed: 0":
+        return df.set_index("Unnamed: 0").rename_axis(None).to_csv()
+    return df.to_csv()
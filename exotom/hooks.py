@@ -1,5 +1,6 @@
 import logging
-from exotom.transits import calculate_transits_during_next_n_days
+from exotom.models import TargetEphemeris
+from exotom.transits import update_transit_catalog
 
 logger = logging.getLogger(__name__)
 
@@ -7,4 +8,5 @@ logger = logging.getLogger(__name__)
 def target_post_save(target, created):
     # update target
     logger.info("Target post save hook: %s created: %s", target, created)
-    calculate_transits_during_next_n_days(target, n_days=10)
+    TargetEphemeris.update_from_target(target)
+    update_transit_catalog([target])
@@ -0,0 +1,120 @@
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from astropy.utils import iers
+from astropy.utils.data import download_file
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+IERS_A_FILENAME = "finals2000A.all"
+LEAP_SECONDS_FILENAME = "Leap_Second.dat"
+
+_configured = False
+
+
+def configure_iers(cache_dir: str = None, force: bool = False):
+    """Pins astropy to the local IERS cache, so that time and coordinate transformations never download anything.
+
+    If the cache contains an IERS-A table and leap seconds (see update_iers_cache), they are used, otherwise astropy
+    falls back to its bundled tables. For times outside the tables, astropy only warns about degraded accuracy.
+
+    :param cache_dir: directory with IERS files, defaults to settings.IERS["cache_dir"]
+    :param force: configure again, even if already done in this process
+    """
+    global _configured
+    if _configured and not force:
+        return
+    _configured = True
+    if cache_dir is None:
+        cache_dir = settings.IERS["cache_dir"]
+
+    iers.conf.auto_download = False
+    iers.conf.iers_degraded_accuracy = "warn"
+
+    # earth orientation
+    path = os.path.join(cache_dir, IERS_A_FILENAME)
+    if os.path.exists(path):
+        try:
+            iers.earth_orientation_table.set(iers.IERS_A.open(path))
+            check_age(path)
+        except Exception as e:
+            log.warning("Could not load IERS-A table from %s: %s", path, e)
+    else:
+        log.warning(
+            "No IERS-A table in %s, using bundled IERS-B table. Run update_iers to download it.",
+            cache_dir,
+        )
+
+    # leap seconds
+    path = os.path.join(cache_dir, LEAP_SECONDS_FILENAME)
+    if os.path.exists(path):
+        iers.conf.system_leap_second_file = path
+        try:
+            iers.LeapSeconds.open(path).update_erfa_leap_seconds()
+            check_age(path)
+        except Exception as e:
+            log.warning("Could not load leap seconds from %s: %s", path, e)
+
+
+def check_age(path: str):
+    age_in_days = (time.time() - os.path.getmtime(path)) / 86400
+    if age_in_days > settings.IERS["max_age_in_days"]:
+        log.warning(
+            "%s is %d days old, accuracy may be degraded. Run update_iers to update it.",
+            path,
+            age_in_days,
+        )
+
+
+def update_iers_cache(cache_dir: str = None):
+    """Downloads current IERS-A table and leap seconds into the local IERS cache and configures astropy to use them.
+
+    Files are only replaced if the download is valid, so a failed update leaves the old files in place.
+    """
+    if cache_dir is None:
+        cache_dir = settings.IERS["cache_dir"]
+    os.makedirs(cache_dir, exist_ok=True)
+
+    downloads = [
+        (
+            IERS_A_FILENAME,
+            [iers.conf.iers_auto_url, iers.conf.iers_auto_url_mirror],
+            iers.IERS_A.open,
+        ),
+        (
+            LEAP_SECONDS_FILENAME,
+            [iers.conf.iers_leap_second_auto_url],
+            iers.LeapSeconds.open,
+        ),
+    ]
+    for filename, urls, open_table in downloads:
+        for url in urls:
+            try:
+                download_and_replace(url, os.path.join(cache_dir, filename), open_table)
+                log.info("Updated %s from %s.", filename, url)
+                break
+            except Exception as e:
+                log.warning("Could not download %s from %s: %s", filename, url, e)
+        else:
+            log.error("Could not update %s, keeping old version.", filename)
+
+    configure_iers(cache_dir, force=True)
+
+
+def download_and_replace(url: str, path: str, open_table):
+    filename = download_file(url, cache=False, timeout=iers.conf.remote_timeout)
+    try:
+        # make sure it can be read
+        open_table(filename)
+
+        # copy next to destination first, so other processes never read incomplete files
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        os.close(fd)
+        shutil.copyfile(filename, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        os.remove(filename)
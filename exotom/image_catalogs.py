@@ -0,0 +1,175 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from exotom.dataframe_storage import read_dataframe
+
+log = logging.getLogger(__name__)
+
+# columns that keep full precision, all other float columns are stored as float32
+FULL_PRECISION_COLUMNS = ["ra", "dec", "time"]
+FULL_PRECISION_COLUMN_PREFIXES = ["flux"]
+
+
+class ImageCatalogs:
+    """Photometry catalogs of all images of an observation, concatenated into a single table.
+
+    Rows offsets[i]:offsets[i + 1] of the table are the catalog of frame i. Coordinates, times and fluxes are stored
+    as float64, all other float columns as float32 and integer columns with the smallest sufficient type. Indexing
+    and iterating return the catalogs of single frames as DataFrames.
+    """
+
+    def __init__(self, table: pd.DataFrame, offsets: np.ndarray):
+        self.table = table
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @classmethod
+    def from_dataframes(
+        cls, catalogs: [pd.DataFrame], required_columns: [str] = None
+    ) -> "ImageCatalogs":
+        """Compacts and concatenates the given catalogs.
+
+        :param catalogs: catalog of each frame
+        :param required_columns: frames without any of these columns are skipped
+        """
+        frames = []
+        for i_cat, cat in enumerate(catalogs):
+            missing_columns = [
+                column for column in required_columns or [] if column not in cat
+            ]
+            if missing_columns:
+                log.info(
+                    "Filtering out frame %d/%d because column %s is missing.",
+                    i_cat,
+                    len(catalogs),
+                    missing_columns[0],
+                )
+                continue
+            frames.append(compact_catalog(cat))
+
+        offsets = np.concatenate([[0], np.cumsum([len(cat) for cat in frames])])
+        if len(frames) == 0:
+            return cls(pd.DataFrame(), offsets)
+        table = pd.concat(frames, ignore_index=True, copy=False)
+        if any(not cat.columns.equals(frames[0].columns) for cat in frames):
+            # frames without a column get NaNs, so types have to be compacted again
+            table = compact_catalog(table)
+        return cls(table, offsets)
+
+    @classmethod
+    def create(cls, catalogs) -> "ImageCatalogs":
+        """Returns the given catalogs as ImageCatalogs, converting them if they are a list of DataFrames."""
+        if isinstance(catalogs, ImageCatalogs):
+            return catalogs
+        return cls.from_dataframes(catalogs)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> pd.DataFrame:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("frame index out of range")
+        return self.table.iloc[self.offsets[i] : self.offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def columns(self) -> pd.Index:
+        return self.table.columns
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """Number of sources in each frame."""
+        return np.diff(self.offsets)
+
+    @property
+    def frame_index(self) -> np.ndarray:
+        """Frame of each row of the table."""
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    @property
+    def times(self) -> list:
+        """Time of each frame, taken from its first source."""
+        return list(self.table["time"].to_numpy()[self.offsets[:-1]])
+
+    def column(self, name: str, dtype=None) -> np.ndarray:
+        """Returns a column of all frames as array."""
+        return self.table[name].to_numpy(dtype=dtype)
+
+    def select(self, frames: np.ndarray) -> "ImageCatalogs":
+        """Returns the catalogs of the frames for which the given boolean array is set."""
+        frames = np.asarray(frames, dtype=bool)
+        rows = np.repeat(frames, self.lengths)
+        offsets = np.concatenate([[0], np.cumsum(self.lengths[frames])])
+        return ImageCatalogs(self.table[rows].reset_index(drop=True), offsets)
+
+    def memory_usage(self) -> int:
+        """Returns memory used by the table in bytes."""
+        return int(self.table.memory_usage(index=True, deep=True).sum())
+
+
+def compact_catalog(catalog: pd.DataFrame) -> pd.DataFrame:
+    """Returns the catalog without the index column of CSV files and with the column types of ImageCatalogs.
+
+    Catalogs that are already compact are returned as they are.
+    """
+    drop_columns = [
+        column for column in catalog.columns if str(column).startswith("Unnamed:")
+    ]
+    types = {}
+    for column, dtype in catalog.dtypes.items():
+        if column in drop_columns:
+            continue
+        if pd.api.types.is_float_dtype(dtype) and not is_full_precision_column(column):
+            if dtype != np.float32:
+                types[column] = np.float32
+        elif pd.api.types.is_integer_dtype(dtype):
+            downcast_type = pd.to_numeric(catalog[column], downcast="integer").dtype
+            if downcast_type != dtype:
+                types[column] = downcast_type
+    if not drop_columns and not types:
+        return catalog
+    return catalog.drop(columns=drop_columns).astype(types)
+
+
+def is_full_precision_column(column) -> bool:
+    return column in FULL_PRECISION_COLUMNS or any(
+        str(column).startswith(prefix) for prefix in FULL_PRECISION_COLUMN_PREFIXES
+    )
+
+
+def load_catalog_files(
+    files: [str], load_file=read_dataframe, workers: int = None, verbose=True
+) -> list:
+    """Loads files in a pool of threads and returns the results in the order of the files.
+
+    Parsing CSV files and decompressing FITS files mostly runs outside of the GIL, so threads load files in parallel
+    without copying catalogs between processes.
+
+    :param files: paths of files
+    :param load_file: function that loads a single file
+    :param workers: number of threads, defaults to settings.CATALOG_LOADING_WORKERS
+    :param verbose: log progress every 100 files
+    """
+    if workers is None:
+        workers = settings.CATALOG_LOADING_WORKERS
+    log.info("Loading %d files with %d threads.", len(files), workers)
+    start = time.time()
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for i, result in enumerate(executor.map(load_file, files), 1):
+            if verbose and i % 100 == 0:
+                log.info("(%d/%d) Loaded %s.", i, len(files), files[i - 1])
+            results.append(result)
+
+    log.info("Load took %.2fs.", time.time() - start)
+    return results
@@ -5,12 +5,21 @@ class Command(BaseCommand):
     help = "Calculate transit times for all targets"
 
     def add_arguments(self, parser):
-        parser.add_argument("--ndays", nargs=1, type=int, default=10)
+        parser.add_argument("--ndays", type=int, default=None)
+        parser.add_argument("--workers", type=int, default=None)
 
     def handle(self, *args, **options):
-        from exotom.transits import calculate_transits_during_next_n_days
+        from exotom.transits import (
+            calculate_transits_for_targets,
+            update_transit_catalog,
+        )
         from exotom.models import Target
 
         n_days = options["ndays"]
-        for target in Target.objects.all():
-            calculate_transits_during_next_n_days(target, n_days)
+        if n_days is None:
+            # extend catalog to planning horizon
+            update_transit_catalog(workers=options["workers"])
+        else:
+            calculate_transits_for_targets(
+                Target.objects.all(), n_days, workers=options["workers"]
+            )
@@ -9,13 +9,11 @@ from exotom.ofi.iagtransit import (
     IAGTransitSingleContactForm,
     IAGTransitFacility,
 )
-from tom_iag.iag import IAGFacility, get_instruments
-from exotom.models import Target, Transit
+from tom_iag.iag import IAGFacility
+from exotom.models import Transit
 
-from exotom.transits import calculate_transits_during_next_n_days
+from exotom.planning_run import PlanningRun
 from exotom.exposure_calculator import calculate_exposure_time
-from astropy.time import Time
-import pytz
 
 from local_settings import MAX_EXPOSURES_PER_REQUEST
 
@@ -27,20 +25,13 @@ class Command(BaseCommand):
         submit_all_transit_contacts()
 
 
-def submit_all_transit_contacts():
-    now = Time.now()
+def submit_all_transit_contacts(planning_run: PlanningRun = None):
+    if planning_run is None:
+        planning_run = PlanningRun()
 
-    targets = Target.objects.all().order_by("id")
+    instruments = planning_run.instruments
 
-    instruments = get_instruments()
-
-    for target in targets:
-
-        calculate_transits_during_next_n_days(target, n_days=1)
-
-        transits_for_target = Transit.objects.filter(
-            target=target, start__gt=now.datetime.astimezone(pytz.utc)
-        )
+    for target, transits_for_target in planning_run.transits_by_target().items():
 
         for site_name, site_info in SITES.items():
             instrument_type = site_info["instrument"]
@@ -48,14 +39,18 @@ def submit_all_transit_contacts():
 
             for transit in transits_for_target:
                 submit_ingresses_egresses_for_transit(
-                    instrument_details, instrument_type, site_name, transit
+                    instrument_details,
+                    instrument_type,
+                    site_name,
+                    transit,
+                    planning_run,
                 )
 
 
 def submit_ingresses_egresses_for_transit(
-    instrument_details, instrument_type, site_name, transit
+    instrument_details, instrument_type, site_name, transit, planning_run
 ):
-    if transit.ingress_observable_at_site(site=site_name):
+    if transit.id in planning_run.transit_ids(site_name, "ingress_observable"):
         try:
             submit_transit_single_contact_to_instrument(
                 transit, instrument_type, instrument_details, contact="INGRESS"
@@ -64,7 +59,7 @@ def submit_ingresses_egresses_for_transit(
             print(f"Error when submitting transit observation to instrument")
             print(traceback.format_exc())
 
-    if transit.egress_observable_at_site(site=site_name):
+    if transit.id in planning_run.transit_ids(site_name, "egress_observable"):
         try:
             submit_transit_single_contact_to_instrument(
                 transit, instrument_type, instrument_details, contact="EGRESS"
@@ -113,7 +108,7 @@ def submit_transit_single_contact_to_instrument(
 def get_observation_data(
     transit: Transit, instrument_type: str, instrument_details: dict, contact: str
 ) -> dict:
-    magnitude = transit.target.targetextra_set.get(key="Mag (TESS)").float_value
+    magnitude = transit.mag
     exposure_time = calculate_exposure_time(magnitude, instrument_type)
 
     data = {
@@ -4,13 +4,11 @@ from django.core.management.base import BaseCommand
 from tom_observations.models import ObservationRecord
 from exotom.settings import FACILITIES, SITES, MAX_EXPOSURES_PER_REQUEST
 from exotom.ofi.iagtransit import IAGTransitForm, IAGTransitFacility
-from tom_iag.iag import IAGFacility, get_instruments
-from exotom.models import Target, Transit
+from tom_iag.iag import IAGFacility
+from exotom.models import Transit
 
-from exotom.transits import calculate_transits_during_next_n_days
+from exotom.planning_run import PlanningRun
 from exotom.exposure_calculator import calculate_exposure_time
-from astropy.time import Time
-import pytz
 
 
 class Command(BaseCommand):
@@ -24,29 +22,24 @@ class Command(BaseCommand):
         submit_all_transits(submit_only_n_transits)
 
 
-def submit_all_transits(submit_only_n_transits: int = -1):
+def submit_all_transits(
+    submit_only_n_transits: int = -1, planning_run: PlanningRun = None
+):
     submission_counter = 0
 
-    now = Time.now()
-
-    targets = Target.objects.all().order_by("id")
-
-    instruments = get_instruments()
+    if planning_run is None:
+        planning_run = PlanningRun()
 
-    for target in targets:
+    instruments = planning_run.instruments
 
-        calculate_transits_during_next_n_days(target, n_days=1)
-
-        transits_for_target = Transit.objects.filter(
-            target=target, start__gt=now.datetime.astimezone(pytz.utc)
-        )
+    for target, transits_for_target in planning_run.transits_by_target().items():
 
         for site_name, site_info in SITES.items():
             instrument_type = site_info["instrument"]
             instrument_details = instruments[instrument_type]
 
             for transit in transits_for_target:
-                if transit.observable_at_site(site=site_name):
+                if transit.id in planning_run.transit_ids(site_name, "observable"):
                     if submit_only_n_transits != -1:
                         if submission_counter >= submit_only_n_transits:
                             return
@@ -102,7 +95,7 @@ def submit_transit_to_instrument(
 def get_observation_data(
     transit: Transit, instrument_type: str, instrument_details: dict
 ) -> dict:
-    magnitude = transit.target.targetextra_set.get(key="Mag (TESS)").float_value
+    magnitude = transit.mag
     exposure_time = calculate_exposure_time(magnitude, instrument_type)
 
     data = {
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from exotom.iers import update_iers_cache
+
+
+class Command(BaseCommand):
+    help = "Download current IERS-A table and leap seconds to the local cache used by astropy."
+
+    def handle(self, *args, **options):
+        update_iers_command()
+
+
+def update_iers_command():
+    update_iers_cache()
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.18 on 2026-10-17 00:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tom_targets", "0018_auto_20200714_1832"),
+        ("exotom", "0006_auto_20210127_1135"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TransitPredictionState",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "fingerprint",
+                    models.CharField(
+                        max_length=40,
+                        verbose_name="Hash of ephemeris and site configuration used for prediction",
+                    ),
+                ),
+                (
+                    "predicted_until",
+                    models.DateTimeField(
+                        verbose_name="Time until which transits are predicted"
+                    ),
+                ),
+                (
+                    "target",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="tom_targets.target",
+                    ),
+                ),
+            ],
+        ),
+    ]
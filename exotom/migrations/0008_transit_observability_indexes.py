@@ -0,0 +1,29 @@
+# Generated by Django 3.2.18 on 2026-10-17 00:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("exotom", "0007_transitpredictionstate"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="transit",
+            name="start",
+            field=models.DateTimeField(
+                db_index=True, verbose_name="Time the transit starts"
+            ),
+        ),
+        migrations.AlterIndexTogether(
+            name="transitobservationdetails",
+            index_together={
+                ("site", "ingress_observable"),
+                ("site", "egress_observable"),
+                ("transit", "facility", "site"),
+                ("site", "observable"),
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.18 on 2026-10-17 00:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("exotom", "0008_transit_observability_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="transitobservationdetails",
+            name="moon_dist_mid",
+            field=models.FloatField(
+                null=True, verbose_name="Distance to moon at mid-transit."
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transitobservationdetails",
+            name="target_alt_end",
+            field=models.FloatField(
+                null=True, verbose_name="Elevation of target at start of transit"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transitobservationdetails",
+            name="target_alt_mid",
+            field=models.FloatField(
+                null=True, verbose_name="Elevation of target at start of transit"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transitobservationdetails",
+            name="target_alt_start",
+            field=models.FloatField(
+                null=True, verbose_name="Elevation of target at start of transit"
+            ),
+        ),
+    ]
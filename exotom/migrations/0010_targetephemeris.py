@@ -0,0 +1,96 @@
+# Generated by Django 3.2.18 on 2026-10-17 00:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+EXTRA_FIELDS = {
+    "epoch": "Epoch (BJD)",
+    "epoch_err": "Epoch (BJD) err",
+    "period": "Period (days)",
+    "period_err": "Period (days) err",
+    "duration": "Duration (hours)",
+    "mag": "Mag (TESS)",
+    "depth": "Depth (mmag)",
+}
+
+
+def copy_ephemerides(apps, schema_editor):
+    Target = apps.get_model("tom_targets", "Target")
+    TargetExtra = apps.get_model("tom_targets", "TargetExtra")
+    TargetEphemeris = apps.get_model("exotom", "TargetEphemeris")
+
+    fields = {name: field for field, name in EXTRA_FIELDS.items()}
+    values = {
+        target_id: {} for target_id in Target.objects.values_list("id", flat=True)
+    }
+    extras = TargetExtra.objects.filter(key__in=fields).values_list(
+        "target_id", "key", "float_value"
+    )
+    for target_id, key, value in extras:
+        values[target_id][fields[key]] = value
+    TargetEphemeris.objects.bulk_create(
+        [
+            TargetEphemeris(target_id=target_id, **target_values)
+            for target_id, target_values in values.items()
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tom_targets", "0018_auto_20200714_1832"),
+        ("exotom", "0009_nullable_observation_details"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TargetEphemeris",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("epoch", models.FloatField(null=True, verbose_name="Epoch (BJD)")),
+                (
+                    "epoch_err",
+                    models.FloatField(null=True, verbose_name="Epoch (BJD) err"),
+                ),
+                ("period", models.FloatField(null=True, verbose_name="Period (days)")),
+                (
+                    "period_err",
+                    models.FloatField(null=True, verbose_name="Period (days) err"),
+                ),
+                (
+                    "duration",
+                    models.FloatField(null=True, verbose_name="Duration (hours)"),
+                ),
+                (
+                    "mag",
+                    models.FloatField(
+                        db_index=True, null=True, verbose_name="Mag (TESS)"
+                    ),
+                ),
+                (
+                    "depth",
+                    models.FloatField(
+                        db_index=True, null=True, verbose_name="Depth (mmag)"
+                    ),
+                ),
+                (
+                    "target",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ephemeris",
+                        to="tom_targets.target",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(copy_ephemerides, migrations.RunPython.noop),
+    ]
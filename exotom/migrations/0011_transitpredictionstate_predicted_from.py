@@ -0,0 +1,23 @@
+# Generated by Django 3.2.18 on 2026-10-17 12:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("exotom", "0010_targetephemeris"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transitpredictionstate",
+            name="predicted_from",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                verbose_name="Time from which transits are predicted",
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -1,9 +1,13 @@
 import logging
 
+import pandas as pd
 from astropy.time import Time
 from astropy import units as u
 from django.db import models
-from tom_targets.models import Target
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.functional import cached_property
+from tom_targets.models import Target, TargetExtra
 
 from datetime import timedelta
 
@@ -16,21 +20,102 @@ from local_settings import (
 log = logging.getLogger(__name__)
 
 
+class TransitQuerySet(models.QuerySet):
+    """Filters transits by the visibility and observability flags of their TransitObservationDetails.
+
+    Each filter is a single query with an EXISTS subquery on the indexed flags, instead of querying the details
+    of every transit separately.
+    """
+
+    def with_details(self, **kwargs):
+        details = TransitObservationDetails.objects.filter(
+            transit=models.OuterRef("pk"), **kwargs
+        )
+        return self.filter(models.Exists(details))
+
+    def with_planning_data(self):
+        """Loads targets, ephemerides, details and target extras of the transits in a constant number of queries
+        and annotates the number of sites each transit is visible and observable from.
+
+        Transit methods use the prefetched details instead of querying them again.
+        """
+        return (
+            self.select_related("target", "target__ephemeris")
+            .prefetch_related(
+                "transitobservationdetails_set", "target__targetextra_set"
+            )
+            .annotate(
+                n_visible_sites=models.Count(
+                    "transitobservationdetails",
+                    filter=models.Q(transitobservationdetails__visible=True),
+                ),
+                n_observable_sites=models.Count(
+                    "transitobservationdetails",
+                    filter=models.Q(transitobservationdetails__observable=True),
+                ),
+            )
+        )
+
+    def visible(self, facility: str = None):
+        if facility is None:
+            return self.with_details(visible=True)
+        return self.with_details(facility=facility, visible=True)
+
+    def ingress_visible(self, facility: str):
+        return self.with_details(facility=facility, ingress_visible=True)
+
+    def egress_visible(self, facility: str):
+        return self.with_details(facility=facility, egress_visible=True)
+
+    def visible_at_site(self, site: str):
+        return self.with_details(site=site, visible=True)
+
+    def observable_at_site(self, site: str):
+        return self.with_details(site=site, observable=True)
+
+    def ingress_visible_at_site(self, site: str):
+        return self.with_details(site=site, ingress_visible=True)
+
+    def ingress_observable_at_site(self, site: str):
+        return self.with_details(site=site, ingress_observable=True)
+
+    def egress_visible_at_site(self, site: str):
+        return self.with_details(site=site, egress_visible=True)
+
+    def egress_observable_at_site(self, site: str):
+        return self.with_details(site=site, egress_observable=True)
+
+
 class Transit(models.Model):
     """A single transit."""
 
+    objects = TransitQuerySet.as_manager()
+
     target = models.ForeignKey(Target, on_delete=models.CASCADE)
     number = models.IntegerField("Transit number")
 
-    start = models.DateTimeField("Time the transit starts")
+    start = models.DateTimeField("Time the transit starts", db_index=True)
     mid = models.DateTimeField("Time of mid-transit")
     end = models.DateTimeField("Time the transit ends")
 
+    @property
+    def target_ephemeris(self) -> "TargetEphemeris":
+        """Ephemeris of the target, which is only queried once per instance of the target."""
+        return TargetEphemeris.for_target(self.target)
+
+    def refresh_from_db(self, *args, **kwargs):
+        self.__dict__.pop("_uncertainty_in_days", None)
+        super().refresh_from_db(*args, **kwargs)
+
+    @cached_property
+    def _uncertainty_in_days(self) -> float:
+        # missing errors count as zero, like in transit prediction
+        epoch_err = self.target_ephemeris.epoch_err or 0.0
+        period_err = self.target_ephemeris.period_err or 0.0
+        return (epoch_err ** 2 + (self.number * period_err) ** 2) ** 0.5
+
     def uncertainty_in_days(self):
-        return (
-            (self.target.extra_fields["Epoch (BJD) err"]) ** 2
-            + (self.number * self.target.extra_fields["Period (days) err"]) ** 2
-        ) ** 0.5
+        return self._uncertainty_in_days
 
     def start_earliest(self, n_sigma: float = 1):
         err = timedelta(days=self.uncertainty_in_days())
@@ -56,6 +141,26 @@ class Transit(models.Model):
         err = timedelta(days=self.uncertainty_in_days())
         return self.end + err * n_sigma
 
+    def get_details(self, **kwargs) -> list:
+        """Returns details with the given field values, from the prefetched details if available."""
+        if "transitobservationdetails_set" in getattr(
+            self, "_prefetched_objects_cache", {}
+        ):
+            return [
+                td
+                for td in self.transitobservationdetails_set.all()
+                if all(getattr(td, key) == value for key, value in kwargs.items())
+            ]
+        return self.transitobservationdetails_set.filter(**kwargs)
+
+    def get_target_extra(self, key: str):
+        """Returns the extra field of the target with the given key or None, from the prefetched extras if
+        available."""
+        for target_extra in self.target.targetextra_set.all():
+            if target_extra.key == key:
+                return target_extra
+        return None
+
     @property
     def facilities(self):
         return list(
@@ -69,62 +174,47 @@ class Transit(models.Model):
         )
 
     def visible(self, facility):
-        return any(
-            [
-                td.visible
-                for td in self.transitobservationdetails_set.filter(facility=facility)
-            ]
-        )
+        return any([td.visible for td in self.get_details(facility=facility)])
 
     def ingress_visible(self, facility):
-        return any(
-            [
-                td.ingress_visible
-                for td in self.transitobservationdetails_set.filter(facility=facility)
-            ]
-        )
+        return any([td.ingress_visible for td in self.get_details(facility=facility)])
 
     def egress_visible(self, facility):
-        return any(
-            [
-                td.egress_visible
-                for td in self.transitobservationdetails_set.filter(facility=facility)
-            ]
-        )
+        return any([td.egress_visible for td in self.get_details(facility=facility)])
 
     def visible_at_site(self, site):
         """Checks if transit is in the sky at the given site."""
-        tds = self.transitobservationdetails_set.filter(site=site)
+        tds = self.get_details(site=site)
         visible = any([td.visible for td in tds])
         return visible
 
     def observable_at_site(self, site):
         """Checks if transit is in the sky at the given site and whether star is bright enough and transit deep enough."""
-        tds = self.transitobservationdetails_set.filter(site=site)
+        tds = self.get_details(site=site)
         observable = any([td.observable for td in tds])
         return observable
 
     def ingress_visible_at_site(self, site):
         """Checks if transit is in the sky at the given site."""
-        tds = self.transitobservationdetails_set.filter(site=site)
+        tds = self.get_details(site=site)
         visible = any([td.ingress_visible for td in tds])
         return visible
 
     def ingress_observable_at_site(self, site):
         """Checks if transit is in the sky at the given site and whether star is bright enough and transit deep enough."""
-        tds = self.transitobservationdetails_set.filter(site=site)
+        tds = self.get_details(site=site)
         observable = any([td.ingress_observable for td in tds])
         return observable
 
     def egress_visible_at_site(self, site):
         """Checks if transit is in the sky at the given site."""
-        tds = self.transitobservationdetails_set.filter(site=site)
+        tds = self.get_details(site=site)
         visible = any([td.egress_visible for td in tds])
         return visible
 
     def egress_observable_at_site(self, site):
         """Checks if transit is in the sky at the given site and whether star is bright enough and transit deep enough."""
-        tds = self.transitobservationdetails_set.filter(site=site)
+        tds = self.get_details(site=site)
         observable = any([td.egress_observable for td in tds])
         return observable
 
@@ -134,11 +224,11 @@ class Transit(models.Model):
 
     @property
     def mag(self):
-        return self.target.extra_fields["Mag (TESS)"]
+        return self.target_ephemeris.mag
 
     @property
     def depth(self):
-        return self.target.extra_fields["Depth (mmag)"]
+        return self.target_ephemeris.depth
 
     class Meta:
         index_together = [
@@ -185,12 +275,19 @@ class TransitObservationDetails(models.Model):
     facility = models.TextField("Name of facility.")
     site = models.TextField("Name of site.")
 
-    target_alt_start = models.FloatField("Elevation of target at start of transit")
-    target_alt_mid = models.FloatField("Elevation of target at start of transit")
-    target_alt_end = models.FloatField("Elevation of target at start of transit")
+    # target positions are not calculated for transits during daytime
+    target_alt_start = models.FloatField(
+        "Elevation of target at start of transit", null=True
+    )
+    target_alt_mid = models.FloatField(
+        "Elevation of target at start of transit", null=True
+    )
+    target_alt_end = models.FloatField(
+        "Elevation of target at start of transit", null=True
+    )
     sun_alt_mid = models.FloatField("Elevation of sun at mid-transit.")
     moon_alt_mid = models.FloatField("Elevation of moon at mid-transit.")
-    moon_dist_mid = models.FloatField("Distance to moon at mid-transit.")
+    moon_dist_mid = models.FloatField("Distance to moon at mid-transit.", null=True)
 
     visible = models.BooleanField("Whether transit is visible", null=True)
     observable = models.BooleanField(
@@ -212,4 +309,136 @@ class TransitObservationDetails(models.Model):
     class Meta:
         index_together = [
             ("transit", "facility", "site"),
+            ("site", "observable"),
+            ("site", "ingress_observable"),
+            ("site", "egress_observable"),
         ]
+
+
+class TransitPredictionState(models.Model):
+    """Fingerprint of ephemeris and site configuration the predicted transits of a target are based on."""
+
+    target = models.OneToOneField(Target, on_delete=models.CASCADE)
+    fingerprint = models.CharField(
+        "Hash of ephemeris and site configuration used for prediction", max_length=40
+    )
+    predicted_from = models.DateTimeField("Time from which transits are predicted")
+    predicted_until = models.DateTimeField("Time until which transits are predicted")
+
+
+class TargetEphemerisQuerySet(models.QuerySet):
+    def to_dataframe(self) -> pd.DataFrame:
+        """Returns the ephemerides as a table indexed by target id, loaded in a single query."""
+        columns = ["target_id", "target__ra", "target__dec"] + list(
+            TargetEphemeris.EXTRA_FIELDS
+        )
+        df = pd.DataFrame.from_records(
+            list(self.values_list(*columns)), columns=columns
+        ).rename(columns={"target__ra": "ra", "target__dec": "dec"})
+        return df.set_index("target_id").astype(float)
+
+
+class TargetEphemeris(models.Model):
+    """Ephemeris of a target as typed columns, so that the ephemerides of all targets can be loaded at once.
+
+    Copied from the extra fields of the target by update_from_target, which is called by the target_post_save hook
+    and whenever one of the extra fields is saved or deleted.
+    """
+
+    # name of extra field by field
+    EXTRA_FIELDS = {
+        "epoch": "Epoch (BJD)",
+        "epoch_err": "Epoch (BJD) err",
+        "period": "Period (days)",
+        "period_err": "Period (days) err",
+        "duration": "Duration (hours)",
+        "mag": "Mag (TESS)",
+        "depth": "Depth (mmag)",
+    }
+
+    objects = TargetEphemerisQuerySet.as_manager()
+
+    target = models.OneToOneField(
+        Target, on_delete=models.CASCADE, related_name="ephemeris"
+    )
+    epoch = models.FloatField("Epoch (BJD)", null=True)
+    epoch_err = models.FloatField("Epoch (BJD) err", null=True)
+    period = models.FloatField("Period (days)", null=True)
+    period_err = models.FloatField("Period (days) err", null=True)
+    duration = models.FloatField("Duration (hours)", null=True)
+    mag = models.FloatField("Mag (TESS)", null=True, db_index=True)
+    depth = models.FloatField("Depth (mmag)", null=True, db_index=True)
+
+    @classmethod
+    def update_from_target(cls, target: Target) -> "TargetEphemeris":
+        """Copies the ephemeris from the extra fields of the target."""
+        ephemeris, _ = cls.objects.update_or_create(
+            target=target, defaults=cls.get_values_from_extra_fields(target.id)
+        )
+        target.ephemeris = ephemeris
+        return ephemeris
+
+    @classmethod
+    def get_values_from_extra_fields(cls, target_id: int) -> dict:
+        """Returns the values of the fields from the extra fields of the target in the database."""
+        extra_fields = dict(
+            TargetExtra.objects.filter(
+                target_id=target_id, key__in=cls.EXTRA_FIELDS.values()
+            ).values_list("key", "value")
+        )
+        values = {}
+        for field, name in cls.EXTRA_FIELDS.items():
+            try:
+                values[field] = float(extra_fields[name])
+            except (KeyError, TypeError, ValueError):
+                values[field] = None
+        return values
+
+    @classmethod
+    def for_target(cls, target: Target) -> "TargetEphemeris":
+        """Returns the ephemeris of the target or, if it hasn't been copied yet, an unsaved one from its extras."""
+        try:
+            return target.ephemeris
+        except cls.DoesNotExist:
+            ephemeris = cls(
+                target=target, **cls.get_values_from_extra_fields(target.id)
+            )
+            # cache it like a saved ephemeris, so that extra fields are only queried once per instance of the target
+            cls.target.field.remote_field.set_cached_value(target, ephemeris)
+            return ephemeris
+
+    @property
+    def extra_fields(self) -> dict:
+        """Ephemeris by name of extra field."""
+        return {
+            name: getattr(self, field)
+            for field, name in self.EXTRA_FIELDS.items()
+            if getattr(self, field) is not None
+        }
+
+    @property
+    def is_complete(self) -> bool:
+        """Whether transits can be predicted from this ephemeris. Missing errors count as zero timing error, without
+        magnitude or depth transits are not observable."""
+        return (
+            self.epoch is not None
+            and self.period is not None
+            and self.duration is not None
+        )
+
+
+@receiver(post_save, sender=TargetExtra)
+def update_target_ephemeris_on_extra_save(sender, instance: TargetExtra, **kwargs):
+    """Keeps the ephemeris in sync with extra fields saved without the target_post_save hook, e.g. by TargetForm after
+    saving the target or by the CSV import."""
+    if instance.key in TargetEphemeris.EXTRA_FIELDS.values():
+        TargetEphemeris.update_from_target(instance.target)
+
+
+@receiver(post_delete, sender=TargetExtra)
+def update_target_ephemeris_on_extra_delete(sender, instance: TargetExtra, **kwargs):
+    # only update an existing ephemeris, since the target itself may be being deleted
+    if instance.key in TargetEphemeris.EXTRA_FIELDS.values():
+        TargetEphemeris.objects.filter(target_id=instance.target_id).update(
+            **TargetEphemeris.get_values_from_extra_fields(instance.target_id)
+        )
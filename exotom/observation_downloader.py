@@ -1,17 +1,24 @@
 import io
+import logging
 import os
-import time
 import traceback
+from functools import partial
 
-import requests
 import pandas as pd
+import astropy.units as u
+from astropy.coordinates import SkyCoord
 from astropy.time import Time
-from django.core.files.base import ContentFile
+from django.conf import settings
 from tom_dataproducts.models import DataProduct, DataProductGroup
 
+from exotom.archive_downloads import ArchiveDownloader
+from exotom.dataframe_storage import save_dataframe
+from exotom.photometry import StreamingLightCurvesExtractor
 from exotom.transit_processor import TransitPhotometryCatalogGroup
 from tom_iag.iag import IAGFacility
 
+log = logging.getLogger(__name__)
+
 
 class TransitObservationDownloader:
     """Downloads photometry catalogs of transit observations and creates transit_all_lightcurves DataProduct"""
@@ -35,6 +42,8 @@ class TransitObservationDownloader:
         transit_dataproduct_group = None
         self.lock_observation_record_for_analysis()
         try:
+            if settings.STREAMING_CATALOG_INGEST:
+                return self.stream_all_lightcurves_dataproduct()
             transit_dataproduct_group = (
                 self.make_photometry_catalog_data_product_group()
             )
@@ -64,21 +73,77 @@ class TransitObservationDownloader:
         reduced_products = self.get_reduced_data_products_and_check_pipeline_finished()
         transit_dataproduct_group = self.create_transit_dataproduct_group()
 
-        for i_product, product in enumerate(reduced_products):
+        # catalogs saved by an earlier run are reused, data products for the others are only created once their
+        # catalog has been downloaded, so that a failed download leaves no data product without a file behind
+        saved_product_ids = set(
+            DataProduct.objects.filter(
+                observation_record=self.observation_record,
+                data_product_type="image_photometry_catalog",
+            )
+            .exclude(data="")
+            .values_list("product_id", flat=True)
+        )
+        new_products = []
+        for product in reduced_products:
+            if str(product["id"]) in saved_product_ids:
+                self.get_or_create_image_photometry_catalog_dataproduct(
+                    product, transit_dataproduct_group
+                )
+            else:
+                new_products.append(product)
+
+        # download concurrently, but save in this thread
+        downloads = self.download_image_catalogs(new_products)
+        for i_product, ((product_data, time_datetime), product) in enumerate(
+            zip(downloads, new_products)
+        ):
             if i_product % 100 == 0:
                 print(
-                    f"creating data product {i_product}/{len(reduced_products)}: {product}"
+                    f"creating data product {i_product}/{len(new_products)}: {product}"
                 )
 
             dp, created = self.get_or_create_image_photometry_catalog_dataproduct(
                 product, transit_dataproduct_group
             )
-
-            if created:
-                self.download_and_save_dataproduct_file(dp, product)
+            self.save_dataproduct_file(dp, product, product_data, time_datetime)
 
         return transit_dataproduct_group
 
+    def stream_all_lightcurves_dataproduct(self):
+        """Creates the transit_all_lightcurves DataProduct from catalogs that are matched while downloading them,
+        without creating image_photometry_catalog DataProducts."""
+        # in the order of the files, so that the ref catalog is built from the same frame as by
+        # TransitPhotometryCatalogGroup
+        reduced_products = sorted(
+            self.get_reduced_data_products_and_check_pipeline_finished(),
+            key=lambda prod: prod["filename"],
+        )
+        target = self.observation_record.target
+        extractor = StreamingLightCurvesExtractor(
+            SkyCoord(target.ra * u.deg, target.dec * u.deg)
+        )
+
+        downloads = self.download_image_catalogs(reduced_products)
+        for i_product, (product_data, time_datetime) in enumerate(downloads):
+            if i_product % 100 == 0:
+                log.info(
+                    "Streaming catalog %d/%d: %s",
+                    i_product,
+                    len(reduced_products),
+                    reduced_products[i_product],
+                )
+            extractor.add_catalog(
+                self.get_catalog_dataframe_from_catalog_and_time(
+                    product_data, time_datetime
+                )
+            )
+
+        return TransitPhotometryCatalogGroup.create_all_lightcurves_dataproduct(
+            extractor.get_target_and_ref_stars_light_curves_df(),
+            self.get_transit_name(self.observation_record),
+            self.observation_record,
+        )
+
     def create_all_lightcurves_dataproduct(self, transit_dataproduct_group):
         transit_photometry_catalog_group = TransitPhotometryCatalogGroup(
             transit_dataproduct_group
@@ -159,36 +224,28 @@ class TransitObservationDownloader:
 
         return transit_dp_group_name
 
-    def download_and_save_dataproduct_file(self, dp, product):
-        product_data, time_datetime = self.attempt_image_catalog_download(
-            product, n_attempts=3
-        )
+    def download_image_catalogs(self, products):
+        """Downloads the catalogs of the products in a pool of threads and yields their data and times in the order of
+        the products."""
+        with ArchiveDownloader(headers=IAGFacility().archive_headers()) as downloader:
+            yield from downloader.map(
+                partial(self.attempt_image_catalog_download, downloader=downloader),
+                products,
+            )
+
+    def save_dataproduct_file(self, dp, product, product_data, time_datetime):
         df = self.get_catalog_dataframe_from_catalog_and_time(
             product_data, time_datetime
         )
-        dfile = ContentFile(df.to_csv())
-        dp.data.save(product["filename"].replace(".fits.gz", ".csv"), dfile)
-        dp.save()
-
-    def attempt_image_catalog_download(self, product, n_attempts):
-        for attempts in range(n_attempts):
-            try:
-                product_data = requests.get(
-                    product["url"].replace("download", "catalog"),
-                    headers=IAGFacility().archive_headers(),
-                ).content
-                time_str = product["created"]
-                break
-            except Exception as e:
-                print(
-                    f"Data request to {product['url']} failed due to '{e}'. {2 - attempts} attempts left..."
-                )
-                time.sleep(0.5)
-        else:
-            raise Exception(
-                f"Couldn't download data from {product['url']} after {n_attempts} due to '{e}'."
-            )
+        save_dataframe(dp, df, product["filename"].replace(".fits.gz", ""))
 
+    def attempt_image_catalog_download(
+        self, product, downloader: ArchiveDownloader, n_attempts: int = None
+    ):
+        product_data = downloader.get(
+            product["url"].replace("download", "catalog"), n_attempts=n_attempts
+        )
+        time_str = product["created"]
         return product_data, time_str
 
     def get_catalog_dataframe_from_catalog_and_time(self, product_data, time_datetime):
@@ -4,7 +4,7 @@ from crispy_forms.layout import Div, Layout
 from django import forms
 from dateutil.parser import parse
 from tom_common.exceptions import ImproperCredentialsException
-from tom_targets.models import Target, TargetExtra
+from tom_targets.models import Target
 from django.conf import settings
 import astropy.units as u
 
@@ -88,8 +88,9 @@ class IAGTransitForm(IAGImagingObservationForm):
         return sorted(
             [
                 (t.number, "#%d: %s" % (t.number, t.start.strftime("%Y/%m/%d %H:%M")))
-                for t in Transit.objects.filter(start__gt=Time.now().isot)
-                if t.visible(self.initial["facility"])
+                for t in Transit.objects.filter(start__gt=Time.now().isot).visible(
+                    self.initial["facility"]
+                )
             ],
             key=lambda x: x[1],
         )
@@ -161,12 +162,8 @@ class IAGTransitForm(IAGImagingObservationForm):
         except Transit.DoesNotExist:
             return {}
 
-        try:
-            is_priority = transit.target.targetextra_set.get(
-                key="Priority Proposal"
-            ).bool_value
-        except TargetExtra.DoesNotExist:
-            is_priority = False
+        priority = transit.get_target_extra("Priority Proposal")
+        is_priority = priority is not None and priority.bool_value
         proposal = PROPOSALS["priority"] if is_priority else PROPOSALS["low_priority"]
 
         # get window
@@ -243,8 +240,9 @@ class IAGTransitSingleContactForm(IAGImagingObservationForm):
                     t.number,
                     "#%d: %s Ingress" % (t.number, t.start.strftime("%Y/%m/%d %H:%M")),
                 )
-                for t in Transit.objects.filter(start__gt=now)
-                if t.ingress_visible(self.initial["facility"])
+                for t in Transit.objects.filter(start__gt=now).ingress_visible(
+                    self.initial["facility"]
+                )
             ]
         )
 
@@ -254,8 +252,9 @@ class IAGTransitSingleContactForm(IAGImagingObservationForm):
                     t.number,
                     "#%d: %s Egress" % (t.number, t.start.strftime("%Y/%m/%d %H:%M")),
                 )
-                for t in Transit.objects.filter(start__gt=now)
-                if t.egress_visible(self.initial["facility"])
+                for t in Transit.objects.filter(start__gt=now).egress_visible(
+                    self.initial["facility"]
+                )
             ]
         )
 
@@ -337,12 +336,8 @@ class IAGTransitSingleContactForm(IAGImagingObservationForm):
         except Transit.DoesNotExist:
             return {}
 
-        try:
-            is_priority = transit.target.targetextra_set.get(
-                key="Priority Proposal"
-            ).bool_value
-        except TargetExtra.DoesNotExist:
-            is_priority = False
+        priority = transit.get_target_extra("Priority Proposal")
+        is_priority = priority is not None and priority.bool_value
         proposal = PROPOSALS["priority"] if is_priority else PROPOSALS["low_priority"]
 
         # get window
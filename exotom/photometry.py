@@ -1,6 +1,9 @@
+import logging
+
 import numpy as np
 from astropy.coordinates import SkyCoord, EarthLocation
 import astropy.units as u
+from scipy.spatial import cKDTree
 
 import matplotlib.pyplot as plt
 import pandas as pd
@@ -9,12 +12,62 @@ from typing import Union
 
 from tom_targets.models import TargetExtra
 
+from exotom.image_catalogs import ImageCatalogs, compact_catalog
 from exotom.models import Transit
 from exotom.tess_transit_fit import TessTransitFit, FitResult
 
+log = logging.getLogger(__name__)
+
 MAX_SEPARATION_TO_CATALOG_IN_DEG = 5 / 3600
 
 
+class RefCatalogMatcher:
+    """Matches sources to their nearest source in a reference catalog, like SkyCoord.match_to_catalog_sky, but builds
+    the KD-tree of the reference catalog only once.
+
+    Sources are compared as unit vectors, and matches further away than max_separation_in_deg are discarded.
+    """
+
+    def __init__(
+        self,
+        ref_catalog_coords: SkyCoord,
+        max_separation_in_deg: float = MAX_SEPARATION_TO_CATALOG_IN_DEG,
+    ):
+        self.tree = cKDTree(
+            self.unit_vectors(
+                ref_catalog_coords.ra.degree, ref_catalog_coords.dec.degree
+            )
+        )
+        self.max_separation_in_deg = max_separation_in_deg
+
+    @staticmethod
+    def unit_vectors(ra: np.ndarray, dec: np.ndarray) -> np.ndarray:
+        ra = np.radians(np.atleast_1d(ra))
+        dec = np.radians(np.atleast_1d(dec))
+        return np.stack(
+            [np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)], axis=-1
+        )
+
+    def match(self, ra: np.ndarray, dec: np.ndarray) -> np.ndarray:
+        """Returns index of nearest reference source for each source or -1 if it is too far away.
+
+        :param ra: right ascensions of sources in degrees
+        :param dec: declinations of sources in degrees
+        """
+        vectors = self.unit_vectors(ra, dec)
+        ids = np.full(len(vectors), -1)
+        valid = np.isfinite(vectors).all(axis=1)
+        if not valid.any() or self.tree.n == 0:
+            return ids
+
+        distances, nearest = self.tree.query(vectors[valid])
+        # chord length to angle
+        separations = np.degrees(2 * np.arcsin(np.minimum(distances / 2, 1)))
+        nearest[separations > self.max_separation_in_deg] = -1
+        ids[valid] = nearest
+        return ids
+
+
 class TransitLightCurveExtractor:
     def __init__(
         self,
@@ -71,32 +124,17 @@ class TransitLightCurveExtractor:
         """
 
         ref_star_columns = self.get_ref_star_columns(light_curves_df.columns)
-        # use sum of all reference lightcurves to remove trend and create relative reference star light curve
-        sum_of_reference_lightcurves = light_curves_df[ref_star_columns].sum(
-            axis="columns"
+        relative_light_curves_stddevs = self.get_relative_light_curves_stddevs(
+            light_curves_df[ref_star_columns].to_numpy(dtype=float)
         )
-        relative_light_curves_stddevs = {}
-        for column in ref_star_columns:
-            comparison_lightcurve = light_curves_df[column]
-            normed_comp_lightcurve = (
-                comparison_lightcurve / comparison_lightcurve.mean()
-            )
-
-            relative_comp_lightcurve = (
-                sum_of_reference_lightcurves / normed_comp_lightcurve
-            )
-
-            relative_lightcurve_stddev = relative_comp_lightcurve.std()
-
-            relative_light_curves_stddevs[column] = relative_lightcurve_stddev
 
         # kappa sigma clip on the standard deviations of relative lightcurves
-        avg = np.mean(list(relative_light_curves_stddevs.values()))
-        std = np.std(list(relative_light_curves_stddevs.values()))
+        avg = np.mean(relative_light_curves_stddevs)
+        std = np.std(relative_light_curves_stddevs)
 
         remove_columns = [
             col
-            for col, col_std in relative_light_curves_stddevs.items()
+            for col, col_std in zip(ref_star_columns, relative_light_curves_stddevs)
             if col_std > avg + kappa * std
         ]
         print(
@@ -105,6 +143,24 @@ class TransitLightCurveExtractor:
         light_curves_df.drop(columns=remove_columns, inplace=True)
         return light_curves_df
 
+    @staticmethod
+    def get_relative_light_curves_stddevs(fluxes: np.ndarray) -> np.ndarray:
+        """Calculates the stddevs of the relative light curves of all ref sources at once.
+
+        The relative light curve of a ref source is the sum of all ref source light curves divided by its light curve
+        normed to its mean, which removes trends common to all sources. NaNs are skipped like in pandas.
+
+        :param fluxes: light curves of ref sources as frames x sources array
+        :return: stddev of relative light curve per ref source
+        """
+        # use sum of all reference lightcurves to remove trend and create relative reference star light curve
+        sum_of_reference_light_curves = np.nansum(fluxes, axis=1)
+        normed_light_curves = fluxes / np.nanmean(fluxes, axis=0)
+        relative_light_curves = (
+            sum_of_reference_light_curves[:, np.newaxis] / normed_light_curves
+        )
+        return np.nanstd(relative_light_curves, axis=0, ddof=1)
+
     def get_ref_star_columns(self, columns):
         return list(filter(lambda col: str(col).isdigit() or type(col) == int, columns))
 
@@ -167,19 +223,22 @@ class TransitLightCurveExtractor:
 
 
 class LightCurvesExtractor:
-    """ Extracts all potential ref star and the target light curves from catalogs of transit images."""
+    """Extracts all potential ref star and the target light curves from catalogs of transit images."""
+
+    # frames without these columns are skipped
+    REQUIRED_COLUMNS = ["ra", "dec", "time", "flux"]
 
     def __init__(
         self,
-        image_catalogs: [],
+        image_catalogs: Union[ImageCatalogs, list],
         target_coord: SkyCoord,
         one_image_for_plot: np.ndarray = None,
         max_allowed_pixel_value: float = 5e4,
         max_allowed_source_ellipticity: float = 0.4,
         min_allowed_source_fwhm: float = 2.5,
     ):
-        self.full_image_catalogs: [pd.DataFrame] = self.filter_out_incomplete_catalogs(
-            image_catalogs
+        self.full_image_catalogs = ImageCatalogs.create(
+            self.filter_out_incomplete_catalogs(image_catalogs)
         )
         self.target_coord: SkyCoord = target_coord
 
@@ -192,7 +251,12 @@ class LightCurvesExtractor:
 
         self.ref_catalog: Union[pd.DataFrame, None] = None
         self.target_id: Union[int, None] = None
-        self.matched_image_catalogs_with_target: Union[list, None] = None
+        self.matched_image_catalogs_with_target: Union[ImageCatalogs, None] = None
+
+        # light curves of valid ref sources, see enforce_each_ref_source_exactly_once_per_image_and_valid_flux
+        self.ref_source_light_curves: Union[pd.DataFrame, None] = None
+        self.ref_source_light_curves_catalogs: Union[ImageCatalogs, None] = None
+        self.ref_source_light_curves_flux_column_name: Union[str, None] = None
 
     def get_target_and_ref_stars_light_curves_df(
         self,
@@ -204,23 +268,17 @@ class LightCurvesExtractor:
             use_only_n_brightest_ref_sources, flux_column_name
         )
 
-        target_light_curve = self.extract_light_curves(
-            self.matched_image_catalogs_with_target, [self.target_id], flux_column_name
-        )[self.target_id]
-
         # remove target form comparison stars
         cmp_ids = list(self.ref_catalog["id"])
         cmp_ids.remove(self.target_id)
-        # get comparison stars light curves
-        cmp_light_curves = self.extract_light_curves(
+        # get comparison stars and target light curves at once
+        light_curve_df = self.extract_light_curves(
             self.matched_image_catalogs_with_target,
-            cmp_ids,
+            cmp_ids + [self.target_id],
             flux_column_name,
             verbose=True,
         )
-
-        light_curve_df = cmp_light_curves
-        light_curve_df["target"] = target_light_curve
+        light_curve_df.columns = cmp_ids + ["target"]
 
         light_curve_df = light_curve_df.reset_index().rename(columns={"index": "time"})
 
@@ -301,33 +359,29 @@ class LightCurvesExtractor:
 
     def match_image_catalogs_to_ref_catalog(self, image_catalogs, ref_catalog_coords):
         """add reference source ids to image_catalog in place"""
-        for i_cat, cat in enumerate(image_catalogs):
-            if i_cat % 100 == 0:
-                print("Matching frame %d/%d ..." % (i_cat, len(image_catalogs) - 1))
-
-            cat_coords = SkyCoord(cat["ra"] * u.deg, cat["dec"] * u.deg, frame="icrs")
-
-            ids, separation_angles, _ = cat_coords.match_to_catalog_sky(
-                ref_catalog_coords
-            )
-            ids[separation_angles.degree > MAX_SEPARATION_TO_CATALOG_IN_DEG] = -1
-            cat["id"] = ids.astype(int)
-
+        image_catalogs = ImageCatalogs.create(image_catalogs)
+        print("Matching %d frames ..." % len(image_catalogs))
+        if len(image_catalogs) == 0:
+            return image_catalogs
+
+        # match sources of all frames at once
+        matcher = RefCatalogMatcher(ref_catalog_coords)
+        image_catalogs.table["id"] = matcher.match(
+            image_catalogs.column("ra", dtype=float),
+            image_catalogs.column("dec", dtype=float),
+        )
         return image_catalogs
 
     def remove_frames_where_target_was_not_matched(self, image_catalogs, target_id):
-        remove_ids = []
-        for i_cat, cat in enumerate(image_catalogs):
-            counts = cat["id"].value_counts()
-            if (not target_id in counts.index) or counts[target_id] != 1:
-                remove_ids.append(i_cat)
+        image_catalogs = ImageCatalogs.create(image_catalogs)
+        target_matches = np.bincount(
+            image_catalogs.frame_index[image_catalogs.column("id") == target_id],
+            minlength=len(image_catalogs),
+        )
         print(
-            f"Removing {len(remove_ids)} frames because the target star was not matched exactly once."
+            f"Removing {np.sum(target_matches != 1)} frames because the target star was not matched exactly once."
         )
-        for remove_id in reversed(remove_ids):
-            image_catalogs.pop(remove_id)
-
-        return image_catalogs
+        return image_catalogs.select(target_matches == 1)
 
     def keep_only_n_brightest_ref_sources_and_target(
         self, ref_catalog, use_only_n_brightest: int = None
@@ -349,53 +403,78 @@ class LightCurvesExtractor:
     ):
         """Enforce that all ref_sources have been identified *exactly once* in each frame.
         if a ref_source is not *exactly once* in a frame or the flux_column_value is nan, remove that source.
+
+        The light curves of the remaining sources are kept for extract_light_curves.
         """
-        times = [cat.iloc[0]["time"] for cat in image_catalogs]
-        ids = ref_catalog.id
-        source_flux_values = pd.DataFrame(index=times, columns=ids)
-
-        for i_cat, catalog in enumerate(image_catalogs):
-            if i_cat % 100 == 0:
-                print("Checking frame %d/%d ..." % (i_cat, len(image_catalogs) - 1))
-
-            time = catalog.iloc[0].time
-            for id in ids:
-                try:
-                    flux_value_series = catalog[catalog.id == id][flux_column_name]
-                    if len(flux_value_series.index) != 1:
-                        raise Exception("ref star not found exactly once")
-                    flux_value = flux_value_series.iloc[0]
-                except Exception as e:
-                    flux_value = np.nan
-
-                source_flux_values.loc[time, id] = flux_value
-
-        any_nan_per_ref_source_series = source_flux_values.isna().any(axis="index")
-        remove_ref_sources_ids = any_nan_per_ref_source_series[
-            any_nan_per_ref_source_series == True
-        ].index
+        image_catalogs = ImageCatalogs.create(image_catalogs)
+        times = image_catalogs.times
+        ids = np.asarray(ref_catalog.id, dtype=int)
+        fluxes, counts = self.get_flux_matrix(
+            image_catalogs, ids, flux_column_name, return_counts=True
+        )
+        valid = ((counts == 1) & ~np.isnan(fluxes)).all(axis=0)
+        remove_ref_sources_ids = pd.Index(ids[~valid], name="id")
 
         print(
             f"Removing these ref_sources b/c they are not exactly once in each image or have '{flux_column_name}' value nan: {remove_ref_sources_ids}"
         )
-        for remove_sources_id in remove_ref_sources_ids:
-            ref_catalog.drop(labels=remove_sources_id, axis="index", inplace=True)
+        ref_catalog.drop(labels=remove_ref_sources_ids, axis="index", inplace=True)
 
+        self.ref_source_light_curves = pd.DataFrame(
+            fluxes[:, valid], index=times, columns=ids[valid]
+        )
+        self.ref_source_light_curves_catalogs = image_catalogs
+        self.ref_source_light_curves_flux_column_name = flux_column_name
         return ref_catalog, image_catalogs
 
     def extract_light_curves(
         self, catalogs, ids_to_extract, flux_column_name, verbose=False
     ) -> pd.DataFrame:
-        times = [cat.iloc[0]["time"] for cat in catalogs]
-        light_curves = pd.DataFrame(index=times, columns=ids_to_extract)
-
-        for id in ids_to_extract:
-            column = [
-                cat[cat["id"] == id].iloc[0][flux_column_name] for cat in catalogs
-            ]
-            light_curves[id] = column
-
-        return light_curves
+        # reuse light curves of ref sources, if they have already been extracted
+        if (
+            catalogs is self.ref_source_light_curves_catalogs
+            and flux_column_name == self.ref_source_light_curves_flux_column_name
+            and set(ids_to_extract).issubset(self.ref_source_light_curves.columns)
+        ):
+            return self.ref_source_light_curves[list(ids_to_extract)].copy()
+
+        catalogs = ImageCatalogs.create(catalogs)
+        times = catalogs.times
+        light_curves = self.get_flux_matrix(catalogs, ids_to_extract, flux_column_name)
+        return pd.DataFrame(light_curves, index=times, columns=ids_to_extract)
+
+    @staticmethod
+    def get_flux_matrix(catalogs, ids, flux_column_name, return_counts=False):
+        """Collects the fluxes of the given sources in all catalogs in a single pass over the concatenated catalogs.
+
+        :return: fluxes as frames x ids array, with the first flux if a source was matched more than once in a
+            frame and NaN if it was not matched at all, and, if return_counts is set, the number of matches of each
+            source in each frame as array of same shape
+        """
+        catalogs = ImageCatalogs.create(catalogs)
+        ids = np.asarray(ids, dtype=int)
+        fluxes = np.full((len(catalogs), len(ids)), np.nan)
+        counts = np.zeros((len(catalogs), len(ids)), dtype=int)
+        if len(catalogs) > 0 and len(ids) > 0:
+            # frame and column in result of all sources in all catalogs
+            frames = catalogs.frame_index
+            cat_ids = catalogs.column("id", dtype=int)
+            cat_fluxes = catalogs.column(flux_column_name, dtype=float)
+            columns_by_id = np.full(max(cat_ids.max(), ids.max()) + 2, -1)
+            columns_by_id[ids] = np.arange(len(ids))
+            columns = columns_by_id[cat_ids]  # unmatched sources have id -1
+
+            # count matches and take first occurrence of each source in each frame
+            matched = np.flatnonzero(columns >= 0)
+            cells = frames[matched] * len(ids) + columns[matched]
+            counts = np.bincount(cells, minlength=counts.size).reshape(counts.shape)
+            _, first = np.unique(cells, return_index=True)
+            matched = matched[first]
+            fluxes[frames[matched], columns[matched]] = cat_fluxes[matched]
+
+        if return_counts:
+            return fluxes, counts
+        return fluxes
 
     def plot_ref_sources_on_image(self, ref_catalog):
         if self.one_image_for_plot is None:
@@ -420,11 +499,13 @@ class LightCurvesExtractor:
         plt.show()
 
     def filter_out_incomplete_catalogs(self, image_catalogs):
+        if isinstance(image_catalogs, ImageCatalogs):
+            # columns are the same for all frames
+            return image_catalogs
 
-        required_columns = ["ra", "dec", "time", "flux"]
         filtered_catalogs = []
         for icat, cat in enumerate(image_catalogs):
-            for required_column in required_columns:
+            for required_column in self.REQUIRED_COLUMNS:
                 if required_column not in cat.columns:
                     print(
                         f"Filtering out frame {icat}/{len(image_catalogs)} because column {required_column} is missing."
@@ -434,3 +515,102 @@ class LightCurvesExtractor:
                 filtered_catalogs.append(cat)
 
         return filtered_catalogs
+
+
+class StreamingLightCurvesExtractor(LightCurvesExtractor):
+    """Extracts the same light curves as LightCurvesExtractor, but from catalogs that are added one at a time.
+
+    The ref catalog is built from the first added catalog, and each catalog is matched to it right away and reduced
+    to a row of fluxes of the ref sources, so that catalogs are never kept in memory.
+    """
+
+    def __init__(
+        self, target_coord: SkyCoord, flux_column_name: str = "flux", **kwargs
+    ):
+        super().__init__([], target_coord, **kwargs)
+        self.flux_column_name = flux_column_name
+        self.matcher: Union[RefCatalogMatcher, None] = None
+
+        # times and fluxes of the ref sources of frames, in which the target was matched exactly once. fluxes of ref
+        # sources, that were not matched exactly once in a frame, are NaN
+        self.times = []
+        self.flux_rows = []
+
+    def add_catalog(self, catalog: pd.DataFrame):
+        """Matches the catalog of the next frame to the ref catalog and appends its fluxes to the light curves."""
+        missing_columns = [
+            column for column in self.REQUIRED_COLUMNS if column not in catalog
+        ]
+        if missing_columns:
+            log.warning(
+                "Filtering out frame %d because column %s is missing.",
+                len(self.times),
+                missing_columns[0],
+            )
+            return
+        catalog = compact_catalog(catalog)
+
+        if self.ref_catalog is None:
+            self.ref_catalog, ref_catalog_coords = self.get_ref_catalog_from_catalog(
+                catalog
+            )
+            self.target_id = self.find_target_id(ref_catalog_coords)
+            self.matcher = RefCatalogMatcher(ref_catalog_coords)
+            log.info("Starting with %d reference sources.", len(self.ref_catalog))
+
+        catalog = catalog.assign(
+            id=self.matcher.match(
+                catalog["ra"].to_numpy(dtype=float),
+                catalog["dec"].to_numpy(dtype=float),
+            )
+        )
+        fluxes, counts = self.get_flux_matrix(
+            [catalog], self.ref_catalog["id"], self.flux_column_name, return_counts=True
+        )
+        if counts[0, self.target_id] != 1:
+            log.info(
+                "Removing frame %d because the target star was not matched exactly once.",
+                len(self.times),
+            )
+            return
+
+        self.times.append(catalog["time"].iloc[0])
+        self.flux_rows.append(np.where(counts[0] == 1, fluxes[0], np.nan))
+
+    def get_target_and_ref_stars_light_curves_df(
+        self,
+        flux_column_name: str = "flux",
+        use_only_n_brightest_ref_sources: int = None,
+    ) -> pd.DataFrame:
+        if self.ref_catalog is None:
+            raise ValueError("No catalogs with all required columns were added.")
+        if (
+            flux_column_name != self.flux_column_name
+            or use_only_n_brightest_ref_sources
+        ):
+            raise ValueError(
+                "Streamed light curves are extracted only for the flux column given on creation."
+            )
+
+        # keep ref sources matched exactly once with valid flux in each frame, like
+        # enforce_each_ref_source_exactly_once_per_image_and_valid_flux
+        ids = self.ref_catalog["id"].to_numpy()
+        fluxes = np.array(self.flux_rows).reshape(len(self.flux_rows), len(ids))
+        valid = ~np.isnan(fluxes).any(axis=0)
+        log.info(
+            "Removing these ref_sources b/c they are not exactly once in each image or have '%s' value nan: %s",
+            flux_column_name,
+            ids[~valid],
+        )
+        self.ref_catalog = self.ref_catalog[valid]
+
+        cmp_ids = list(self.ref_catalog["id"])
+        cmp_ids.remove(self.target_id)
+        light_curve_df = pd.DataFrame(
+            fluxes[:, valid], index=self.times, columns=list(ids[valid])
+        )[cmp_ids + [self.target_id]]
+        light_curve_df.columns = cmp_ids + ["target"]
+
+        light_curve_df = light_curve_df.reset_index().rename(columns={"index": "time"})
+
+        return light_curve_df
@@ -0,0 +1,71 @@
+import datetime
+
+import astropy.units as u
+import pytz
+from astropy.time import Time, TimeDelta
+from tom_iag.iag import get_instruments
+
+from exotom.models import Target, Transit, TransitQuerySet
+from exotom.transits import update_transit_catalog
+
+
+class PlanningRun:
+    """Transits of all targets during the next n days, calculated once and shared by all submitters of a run."""
+
+    def __init__(self, n_days: float = 1, now: Time = None):
+        self.now = Time.now() if now is None else now
+        self.n_days = n_days
+        self._transits = None
+        self._instruments = None
+        self._transit_ids = {}
+
+    @property
+    def start(self) -> datetime.datetime:
+        return self.now.datetime.astimezone(pytz.utc)
+
+    @property
+    def end(self) -> datetime.datetime:
+        return (self.now + TimeDelta(self.n_days * u.day)).datetime.astimezone(pytz.utc)
+
+    @property
+    def instruments(self) -> dict:
+        """Instruments available at the observation portal, fetched on first use."""
+        if self._instruments is None:
+            self._instruments = get_instruments()
+        return self._instruments
+
+    @property
+    def transits(self) -> [Transit]:
+        """All transits starting after now with mid-transit during the next n days, ordered by target.
+
+        The transit catalog of all targets is updated on first use.
+        """
+        if self._transits is None:
+            update_transit_catalog(start_time=self.now)
+            self._transits = list(
+                self.get_queryset().with_planning_data().order_by("target_id", "start")
+            )
+        return self._transits
+
+    def get_queryset(self) -> TransitQuerySet:
+        return Transit.objects.filter(start__gt=self.start, mid__lte=self.end)
+
+    def transit_ids(self, site: str, flag: str = "observable") -> set:
+        """Returns ids of transits in this run, for which the given flag of their details at the site is set.
+
+        :param site: name of site
+        :param flag: observable, ingress_observable, egress_observable or the corresponding visible flag
+        """
+        if (site, flag) not in self._transit_ids:
+            # make sure transits are calculated
+            self.transits
+            transits = self.get_queryset().with_details(site=site, **{flag: True})
+            self._transit_ids[site, flag] = set(transits.values_list("id", flat=True))
+        return self._transit_ids[site, flag]
+
+    def transits_by_target(self) -> {Target: [Transit]}:
+        """Returns transits grouped by target, ordered by target id."""
+        transits_by_target = {}
+        for transit in self.transits:
+            transits_by_target.setdefault(transit.target, []).append(transit)
+        return transits_by_target
@@ -185,6 +185,50 @@ CACHES = {
     }
 }
 
+# Tables of sun and moon positions at the sites, used for transit planning. Linear interpolation between
+# points of a table with the given resolution must not exceed the given error, otherwise the table is refined.
+# Tables are stored next to the data products, so they survive restarts and are shared by web and celery workers.
+SUN_MOON_EPHEMERIS = {
+    "resolution_in_mins": 1,
+    "max_error_in_deg": 0.01,
+    "cache_dir": os.path.join(MEDIA_ROOT, "cache", "ephemeris"),
+}
+
+# Number of processes used for calculating transits of all targets, 1 calculates them in the calling process.
+# Worker processes cannot be started from within daemonic processes, e.g. celery's prefork pool.
+TRANSIT_PLANNING_WORKERS = 1
+
+# Format of photometry catalogs and light curves: feather (memory-mapped when reading), parquet or csv. Needs pyarrow,
+# otherwise csv is used. All of them can be downloaded as CSV.
+DATAFRAME_STORAGE_FORMAT = "feather"
+
+# Number of threads used for loading the photometry catalogs of an observation.
+CATALOG_LOADING_WORKERS = 4
+
+# Extract light curves while downloading photometry catalogs, without storing the catalogs as data products first.
+STREAMING_CATALOG_INGEST = False
+
+# Downloads of photometry catalogs from the archive: number of threads, concurrent connections to each host, attempts
+# per file and mean delay before the first retry, which doubles for each further retry.
+ARCHIVE_DOWNLOADS = {
+    "workers": 8,
+    "max_connections_per_host": 4,
+    "n_attempts": 3,
+    "backoff_in_s": 0.5,
+    "timeout_in_s": 60,
+}
+
+# Local cache of IERS-A table and leap seconds used by astropy, which never downloads them itself. Update it with
+# the update_iers management command, files older than max_age_in_days cause a warning. Like the data products, the
+# cache has to be on a volume shared by web and celery workers, so that the weekly update reaches all of them.
+IERS = {
+    "cache_dir": os.path.join(MEDIA_ROOT, "cache", "iers"),
+    "max_age_in_days": 30,
+}
+
+# Transits of all targets are predicted for this number of weeks ahead and extended every night.
+TRANSIT_PLANNING_HORIZON_IN_WEEKS = 2
+
 # TOM Specific configuration
 TARGET_TYPE = "SIDEREAL"
 
@@ -212,15 +256,15 @@ DATA_PRODUCT_TYPES = {
     "fits_file": ("fits_file", "FITS File"),
     "image_photometry_catalog": (
         "image_photometry_catalog",
-        "Image Photometry Catalog CSV",
+        "Image Photometry Catalog",
     ),
     "transit_all_light_curves": (
         "transit_all_light_curves",
-        "All Ref Star Light Curves CSV",
+        "All Ref Star Light Curves",
     ),
     "transit_best_light_curves": (
         "transit_best_light_curves",
-        "Best Transit Light Curves CSV",
+        "Best Transit Light Curves",
     ),
     "transit_fit_report": (
         "transit_fit_report",
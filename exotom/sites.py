@@ -0,0 +1,60 @@
+import threading
+
+import astropy.units as u
+from astroplan import Observer
+from astropy.coordinates import EarthLocation
+
+from exotom.ofi.iagtransit import IAGTransitFacility
+from exotom.sun_moon_ephemeris import SunMoonEphemeris
+from local_settings import COORDS_BY_INSTRUMENT
+
+
+class Site:
+    """Location of a site with its astroplan Observer and SunMoonEphemeris, which are expensive to create and
+    therefore shared by everything in this process, see get_site and get_instrument_site.
+    """
+
+    def __init__(self, latitude: float, longitude: float, elevation: float):
+        self.location = EarthLocation(
+            lat=latitude * u.deg, lon=longitude * u.deg, height=elevation * u.m
+        )
+        self.observer = Observer(location=self.location)
+        self._sun_moon_ephemeris = None
+        self._lock = threading.Lock()
+
+    @property
+    def sun_moon_ephemeris(self) -> SunMoonEphemeris:
+        """Sun/moon ephemeris of site, which is created on first use."""
+        with self._lock:
+            if self._sun_moon_ephemeris is None:
+                self._sun_moon_ephemeris = SunMoonEphemeris(self.observer)
+            return self._sun_moon_ephemeris
+
+
+# sites by ("site", name) or ("instrument", instrument type)
+_sites = {}
+_lock = threading.Lock()
+
+
+def get_site(name: str) -> Site:
+    """Returns the site of the transit facility with the given name."""
+    return _get_or_create(("site", name), IAGTransitFacility.SITES[name])
+
+
+def get_instrument_site(instrument: str) -> Site:
+    """Returns the site of the given instrument type."""
+    return _get_or_create(("instrument", instrument), COORDS_BY_INSTRUMENT[instrument])
+
+
+def get_all_sites() -> {str: Site}:
+    """Returns all sites of the transit facility by name."""
+    return {name: get_site(name) for name in IAGTransitFacility.SITES}
+
+
+def _get_or_create(key: tuple, coords: dict) -> Site:
+    with _lock:
+        if key not in _sites:
+            _sites[key] = Site(
+                coords["latitude"], coords["longitude"], coords["elevation"]
+            )
+        return _sites[key]
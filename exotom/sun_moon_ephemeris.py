@@ -0,0 +1,235 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from astroplan import Observer
+from astropy.coordinates import SkyCoord
+from astropy.time import Time
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+
+class SunMoonEphemeris:
+    """Positions of sun and moon at a site, tabulated on a regular time grid and linearly interpolated in between.
+
+    Tables are calculated for whole UTC days when they are first needed and saved to disk, so that they can be
+    reused by other targets, later runs and other processes. Positions are stored as unit vectors in the AltAz
+    frame of the site. If the estimated interpolation error of a table exceeds max_error_in_deg, the grid is
+    refined until it does not.
+
+    Tables and night intervals in memory are evicted least recently used first, so that ephemerides kept for the
+    lifetime of a worker process do not grow with every run. Both caches are guarded by a lock, since ephemerides
+    are shared by all threads, see exotom.sites.
+    """
+
+    # number of tables and of night interval queries kept in memory
+    MAX_CACHED_TABLES = 64
+    MAX_CACHED_NIGHTS = 8
+
+    def __init__(
+        self,
+        observer: Observer,
+        resolution_in_mins: float = None,
+        max_error_in_deg: float = None,
+        cache_dir: str = None,
+    ):
+        self.observer = observer
+        self.resolution_in_mins = (
+            resolution_in_mins
+            if resolution_in_mins is not None
+            else settings.SUN_MOON_EPHEMERIS["resolution_in_mins"]
+        )
+        self.max_error_in_deg = (
+            max_error_in_deg
+            if max_error_in_deg is not None
+            else settings.SUN_MOON_EPHEMERIS["max_error_in_deg"]
+        )
+        self.cache_dir = (
+            cache_dir
+            if cache_dir is not None
+            else settings.SUN_MOON_EPHEMERIS["cache_dir"]
+        )
+
+        # tables by MJD of day: (jd, sun vectors, moon vectors)
+        self.tables = OrderedDict()
+
+        # night intervals by (first day, last day, max_sun_alt)
+        self.nights = OrderedDict()
+
+        self._lock = threading.Lock()
+
+    def sun_alt(self, times: Time) -> np.ndarray:
+        """Returns altitude of sun in degrees at given times."""
+        sun, _ = self.get_positions(times)
+        return self.alt_from_vectors(sun)
+
+    def moon_alt(self, times: Time) -> np.ndarray:
+        """Returns altitude of moon in degrees at given times."""
+        _, moon = self.get_positions(times)
+        return self.alt_from_vectors(moon)
+
+    def moon_separation(self, times: Time, coords: SkyCoord) -> np.ndarray:
+        """Returns distance of coords (in AltAz frame of site at times) to moon in degrees."""
+        _, moon = self.get_positions(times)
+        vectors = self.vectors_from_altaz(coords.alt.radian, coords.az.radian)
+        cos_separation = np.clip(np.sum(vectors * moon, axis=-1), -1, 1)
+        return np.degrees(np.arccos(cos_separation))
+
+    def night_intervals(
+        self, start: Time, end: Time, max_sun_alt: float = -12
+    ) -> np.ndarray:
+        """Returns intervals on the UTC days from start to end, in which the sun is below max_sun_alt.
+
+        Intervals are taken from the tables and extended by one step on each side and a small margin in altitude,
+        so that they contain all times at which sun_alt is below max_sun_alt.
+
+        :return: array of shape (n, 2) with start and end of nights as JD (UTC), sorted by time
+        """
+        first_day = int(np.floor(start.utc.mjd))
+        last_day = int(np.floor(end.utc.mjd))
+        key = (first_day, last_day, max_sun_alt)
+        nights = self.get_from_cache(self.nights, key)
+        if nights is not None:
+            return nights
+
+        tables = [self.get_table(day) for day in range(first_day, last_day + 1)]
+        jds = np.concatenate([table_jds for table_jds, _, _ in tables])
+        sun_alts = self.alt_from_vectors(
+            np.concatenate([table_sun for _, table_sun, _ in tables])
+        )
+
+        # dark points and their neighbours
+        dark = sun_alts < max_sun_alt + 0.1
+        dark[1:] |= sun_alts[:-1] < max_sun_alt + 0.1
+        dark[:-1] |= sun_alts[1:] < max_sun_alt + 0.1
+
+        # runs of dark points
+        changes = np.diff(dark.astype(int))
+        starts = np.flatnonzero(changes == 1) + 1
+        ends = np.flatnonzero(changes == -1)
+        if dark[0]:
+            starts = np.insert(starts, 0, 0)
+        if dark[-1]:
+            ends = np.append(ends, len(dark) - 1)
+
+        nights = np.stack([jds[starts], jds[ends]], axis=-1)
+        self.add_to_cache(self.nights, key, nights, self.MAX_CACHED_NIGHTS)
+        return nights
+
+    def get_positions(self, times: Time) -> (np.ndarray, np.ndarray):
+        """Returns interpolated unit vectors of sun and moon at given times, with shape times.shape + (3,)."""
+        jds = np.atleast_1d(times.utc.jd)
+        days = np.floor(jds - 2400000.5).astype(int)
+
+        sun = np.empty(jds.shape + (3,))
+        moon = np.empty(jds.shape + (3,))
+        for day in np.unique(days):
+            in_day = days == day
+            table_jds, table_sun, table_moon = self.get_table(day)
+            for i in range(3):
+                sun[in_day, i] = np.interp(jds[in_day], table_jds, table_sun[:, i])
+                moon[in_day, i] = np.interp(jds[in_day], table_jds, table_moon[:, i])
+
+        # interpolated vectors are slightly shorter than unit vectors
+        sun /= np.linalg.norm(sun, axis=-1, keepdims=True)
+        moon /= np.linalg.norm(moon, axis=-1, keepdims=True)
+        return sun.reshape(times.shape + (3,)), moon.reshape(times.shape + (3,))
+
+    def get_table(self, day: int) -> (np.ndarray, np.ndarray, np.ndarray):
+        """Returns table for day with given MJD, loading it from disk or calculating it if necessary."""
+        table = self.get_from_cache(self.tables, day)
+        if table is not None:
+            return table
+
+        path = os.path.join(self.cache_dir, self.get_table_filename(day))
+        try:
+            with np.load(path) as data:
+                table = data["jd"], data["sun"], data["moon"]
+        except (OSError, KeyError, ValueError):
+            table = self.calculate_table(day)
+            self.save_table(path, table)
+
+        self.add_to_cache(self.tables, day, table, self.MAX_CACHED_TABLES)
+        return table
+
+    def calculate_table(self, day: int) -> (np.ndarray, np.ndarray, np.ndarray):
+        resolution_in_mins = self.resolution_in_mins
+        while True:
+            n_steps = int(np.ceil(1440 / resolution_in_mins))
+            times = Time(
+                day + np.linspace(0, 1, n_steps + 1), format="mjd", scale="utc"
+            )
+            sun_altaz = self.observer.sun_altaz(times)
+            moon_altaz = self.observer.moon_altaz(times)
+            sun = self.vectors_from_altaz(sun_altaz.alt.radian, sun_altaz.az.radian)
+            moon = self.vectors_from_altaz(moon_altaz.alt.radian, moon_altaz.az.radian)
+
+            # error of linear interpolation is bounded by an eighth of the second differences
+            max_error_in_deg = max(
+                self.estimate_interpolation_error_in_deg(sun),
+                self.estimate_interpolation_error_in_deg(moon),
+            )
+            if max_error_in_deg <= self.max_error_in_deg:
+                break
+            resolution_in_mins /= 2
+            log.info(
+                "Interpolation error of %.2g° too large, refining sun/moon ephemeris to %.3g mins.",
+                max_error_in_deg,
+                resolution_in_mins,
+            )
+
+        return times.jd, sun, moon
+
+    def save_table(self, path: str, table: (np.ndarray, np.ndarray, np.ndarray)):
+        jds, sun, moon = table
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # write to temporary file first, so other processes never read incomplete tables
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".npz")
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, jd=jds, sun=sun, moon=moon)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning("Could not save sun/moon ephemeris to %s: %s", path, e)
+
+    def get_table_filename(self, day: int) -> str:
+        location = self.observer.location
+        key = (
+            f"{location.x.value:.1f},{location.y.value:.1f},{location.z.value:.1f},"
+            f"{self.resolution_in_mins},{self.max_error_in_deg}"
+        )
+        return f"sun_moon_{day}_{hashlib.md5(key.encode()).hexdigest()[:12]}.npz"
+
+    def get_from_cache(self, cache: OrderedDict, key):
+        """Returns the cached value for key, or None if it is not cached."""
+        with self._lock:
+            if key not in cache:
+                return None
+            cache.move_to_end(key)
+            return cache[key]
+
+    def add_to_cache(self, cache: OrderedDict, key, value, max_size: int):
+        with self._lock:
+            cache[key] = value
+            while len(cache) > max_size:
+                cache.popitem(last=False)
+
+    @staticmethod
+    def estimate_interpolation_error_in_deg(vectors: np.ndarray) -> float:
+        second_differences = vectors[2:] - 2 * vectors[1:-1] + vectors[:-2]
+        return np.degrees(np.max(np.linalg.norm(second_differences, axis=-1)) / 8)
+
+    @staticmethod
+    def alt_from_vectors(vectors: np.ndarray) -> np.ndarray:
+        return np.degrees(np.arcsin(np.clip(vectors[..., 2], -1, 1)))
+
+    @staticmethod
+    def vectors_from_altaz(alt: np.ndarray, az: np.ndarray) -> np.ndarray:
+        return np.stack(
+            [np.cos(alt) * np.cos(az), np.cos(alt) * np.sin(az), np.sin(alt)], axis=-1
+        )
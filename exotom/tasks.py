@@ -1,5 +1,3 @@
-from tom_targets.models import Target
-
 from exotom.management.commands.process_new_observations import (
     process_new_observations_command,
 )
@@ -10,21 +8,21 @@ from exotom.management.commands.submit_transit_contact_observations import (
 from exotom.management.commands.update_observation_status import (
     update_observation_status_command,
 )
-from exotom.transits import calculate_transits_during_next_n_days
+from exotom.management.commands.update_iers import update_iers_command
+from exotom.planning_run import PlanningRun
 from exotom.celery import app
 
 
 @app.task
 def submit_observations():
     # calculate transits for next 24 hours
-    for target in Target.objects.all():
-        calculate_transits_during_next_n_days(target, 1)
+    planning_run = PlanningRun(n_days=1)
 
     # submit observable transits
-    submit_all_transits()
+    submit_all_transits(planning_run=planning_run)
 
     # submit just ingres/egress
-    submit_all_transit_contacts()
+    submit_all_transit_contacts(planning_run=planning_run)
 
 
 @app.task
@@ -35,3 +33,8 @@ def update_observation_status():
 @app.task
 def process_new_observations():
     process_new_observations_command()
+
+
+@app.task
+def update_iers():
+    update_iers_command()
@@ -0,0 +1,15 @@
+from django import template
+from tom_dataproducts.models import DataProduct
+
+from exotom.dataframe_storage import DATAFRAME_DATA_PRODUCT_TYPES
+
+register = template.Library()
+
+
+@register.inclusion_tag("exotom/partials/dataframe_csv_downloads.html")
+def dataframe_csv_downloads(target):
+    """Lists the data products of the target that are stored by save_dataframe and can thus be downloaded as CSV."""
+    products = DataProduct.objects.filter(
+        target=target, data_product_type__in=DATAFRAME_DATA_PRODUCT_TYPES
+    ).order_by("product_id")
+    return {"products": products}
@@ -4,7 +4,7 @@ from django import template
 from tom_dataproducts.models import DataProduct
 from tom_observations.models import ObservationRecord
 
-from exotom.models import Transit
+from exotom.models import TargetEphemeris, Transit
 
 register = template.Library()
 
@@ -61,6 +61,9 @@ def whats_new(n_most_recent_observations=5):
 @register.filter
 def get_target_extra(target, key):
     print(f"'{key}'")
+    if key in TargetEphemeris.EXTRA_FIELDS.values():
+        value = TargetEphemeris.for_target(target).extra_fields.get(key)
+        return "" if value is None else str(value)
     try:
         return str(target.targetextra_set.get(key=key).value)
     except Exception as e:
@@ -14,8 +14,11 @@ from scipy import optimize
 from scipy.interpolate import interpolate
 from tom_targets.models import TargetExtra
 
+from exotom.iers import configure_iers
 from exotom.models import Transit
 
+configure_iers()
+
 
 @contextmanager
 def write_stdout_to_stringbfuffer() -> StringIO:
@@ -295,7 +298,7 @@ class TessTransitFit:
     def get_transit_params_object(self):
         params: batman.TransitParams = batman.TransitParams()
         params.t0 = Time(self.transit.mid).jd
-        params.per = self.get_target_extra(key="Period (days)").float_value
+        params.per = self.transit.target_ephemeris.period
         # convert to solar radii
         PLANET_RADIUS_DEFAULT = 2.0
         planet_radius_in_earth_radii = self.get_target_extra(
@@ -336,11 +339,9 @@ class TessTransitFit:
             radius_sun_in_m = 7e8
 
             # system parameters
-            apparent_magnitude = self.get_target_extra(key="Mag (TESS)").float_value
+            apparent_magnitude = self.transit.target_ephemeris.mag
             distance = self.get_target_extra(key="Stellar Distance (pc)").float_value
-            period_in_s = (
-                self.get_target_extra(key="Period (days)").float_value * 24 * 60 * 60
-            )
+            period_in_s = self.transit.target_ephemeris.period * 24 * 60 * 60
             DEFAULT_STELLAR_RADIUS = 0.5
             stellar_radius = self.get_target_extra(
                 key="Stellar Radius (R_Sun)"
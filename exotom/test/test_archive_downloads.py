@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import skipUnless
+
+import requests
+from django.test import TestCase
+
+from exotom.archive_downloads import ArchiveDownloader
+from exotom.observation_downloader import TransitObservationDownloader
+
+
+class FakeArchiveHandler(BaseHTTPRequestHandler):
+    """Stand-in for the archive, which answers after a delay. /flaky/ paths fail on the first request with 503,
+    /missing always with 404."""
+
+    protocol_version = "HTTP/1.1"
+    delay_in_s = 0.1
+
+    lock = threading.Lock()
+    requests = Counter()
+    authorizations = set()
+    client_ports = set()
+    active = 0
+    max_active = 0
+
+    def do_GET(self):
+        cls = FakeArchiveHandler
+        with cls.lock:
+            cls.requests[self.path] += 1
+            n_requests = cls.requests[self.path]
+            cls.authorizations.add(self.headers.get("Authorization"))
+            cls.client_ports.add(self.client_address[1])
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        time.sleep(self.delay_in_s)
+        with cls.lock:
+            cls.active -= 1
+
+        if self.path == "/missing":
+            status, body = 404, b"not found"
+        elif self.path.startswith("/flaky/") and n_requests == 1:
+            status, body = 503, b"unavailable"
+        else:
+            status, body = 200, f"catalog of {self.path}".encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Test(TestCase):
+    def setUp(self) -> None:
+        FakeArchiveHandler.requests = Counter()
+        FakeArchiveHandler.authorizations = set()
+        FakeArchiveHandler.client_ports = set()
+        FakeArchiveHandler.max_active = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeArchiveHandler)
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_thread.join()
+
+    def test_concurrent_downloads_with_limited_connections(self):
+        urls = [f"{self.url}/file/{i}" for i in range(24)]
+
+        with ArchiveDownloader(
+            headers={"Authorization": "Token secret"},
+            workers=8,
+            max_connections_per_host=4,
+        ) as downloader:
+            contents = list(downloader.map(downloader.get, urls))
+
+        self.assertEqual(
+            contents, [f"catalog of /file/{i}".encode() for i in range(24)]
+        )
+        self.assertEqual(FakeArchiveHandler.max_active, 4)
+        # connections of the session are reused
+        self.assertLessEqual(len(FakeArchiveHandler.client_ports), 4)
+        self.assertEqual(FakeArchiveHandler.authorizations, {"Token secret"})
+
+    def test_download_image_catalog_with_given_downloader(self):
+        product = {"url": f"{self.url}/download/1", "created": "2021-02-21T01:00:00"}
+
+        with ArchiveDownloader() as downloader:
+            product_data, time_str = TransitObservationDownloader(
+                None
+            ).attempt_image_catalog_download(product, downloader)
+
+        self.assertEqual(product_data, b"catalog of /catalog/1")
+        self.assertEqual(time_str, "2021-02-21T01:00:00")
+
+    @skipUnless(os.environ.get("EXOTOM_BENCHMARKS"), "set EXOTOM_BENCHMARKS to run")
+    def test_download_throughput_benchmark(self):
+        urls = [f"{self.url}/file/{i}" for i in range(48)]
+
+        start = time.perf_counter()
+        for url in urls:
+            requests.get(url).content
+        sequential_duration = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ArchiveDownloader() as downloader:
+            list(downloader.map(downloader.get, urls))
+        duration = time.perf_counter() - start
+
+        print(
+            f"Downloaded {len(urls)} files with {len(urls) / duration:.1f} files/s, "
+            f"{len(urls) / sequential_duration:.1f} files/s with requests.get one after another."
+        )
+
+    def test_retries_failed_requests(self):
+        with ArchiveDownloader(n_attempts=3, backoff_in_s=0.01) as downloader:
+            with self.assertLogs("exotom.archive_downloads", level="WARNING"):
+                contents = list(
+                    downloader.map(
+                        downloader.get, [f"{self.url}/flaky/{i}" for i in range(4)]
+                    )
+                )
+            self.assertEqual(contents[2], b"catalog of /flaky/2")
+
+            with self.assertRaises(Exception):
+                downloader.get(f"{self.url}/missing")
+        self.assertEqual(FakeArchiveHandler.requests["/flaky/2"], 2)
+        # client errors are not retried
+        self.assertEqual(FakeArchiveHandler.requests["/missing"], 1)
+
+    def test_backoff_grows_exponentially_with_jitter(self):
+        downloader = ArchiveDownloader(backoff_in_s=1, workers=1)
+        delays = [downloader.get_backoff_delay(2) for _ in range(100)]
+        downloader.close()
+
+        self.assertTrue(all(2 <= delay <= 6 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
@@ -0,0 +1,96 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from tom_dataproducts.models import DataProduct
+
+from exotom.dataframe_storage import save_dataframe, read_dataframe, dataframe_to_csv
+from exotom.models import Target
+
+
+class Test(TestCase):
+    def setUp(self) -> None:
+        self.target = Target.objects.create(
+            name="HAT-P-36b", type="SIDEREAL", ra=188.27, dec=44.92
+        )
+        # like light curves, with integer ids of ref stars as columns
+        self.df = pd.DataFrame(
+            np.random.default_rng(42).uniform(1e3, 1e5, (20, 3)),
+            columns=[0, 2, "target"],
+        )
+        self.df.insert(0, "time", 2459000 + np.arange(20) / 1440)
+
+    def tearDown(self) -> None:
+        for dp in DataProduct.objects.all():
+            os.remove(dp.data.path)
+
+    def save(self, storage_format: str) -> DataProduct:
+        dp = DataProduct.objects.create(
+            product_id=f"light_curves_{storage_format}",
+            target=self.target,
+            data_product_type="transit_all_light_curves",
+        )
+        save_dataframe(dp, self.df, dp.product_id, storage_format)
+        return dp
+
+    def test_formats_are_read_like_csv(self):
+        for storage_format in ["feather", "parquet", "csv"]:
+            with self.subTest(storage_format=storage_format):
+                dp = self.save(storage_format)
+                self.assertTrue(dp.data.name.endswith("." + storage_format))
+
+                df = read_dataframe(dp.data.path)
+                if storage_format == "csv":
+                    expected = pd.read_csv(io.StringIO(self.df.to_csv()))
+                    pd.testing.assert_frame_equal(df, expected, check_exact=False)
+                else:
+                    # binary formats keep floats exactly and don't need an index column
+                    pd.testing.assert_frame_equal(
+                        df, self.df.rename(columns=str), check_exact=True
+                    )
+
+    @override_settings(DATAFRAME_STORAGE_FORMAT="feather")
+    def test_download_as_csv(self):
+        dp = self.save("feather")
+        user = User.objects.create_user("user")
+        self.client.force_login(user)
+
+        response = self.client.get(reverse("dataproduct_csv", kwargs={"pk": dp.id}))
+
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn("light_curves_feather.csv", response["Content-Disposition"])
+        self.assertEqual(
+            response.content.decode(),
+            dataframe_to_csv(read_dataframe(dp.data.path)),
+        )
+        pd.testing.assert_frame_equal(
+            pd.read_csv(io.StringIO(response.content.decode()), index_col=0),
+            self.df.rename(columns=str),
+        )
+
+    def test_csv_download_only_for_dataframe_products(self):
+        dp = self.save("feather")
+        photometry_dp = DataProduct.objects.create(
+            product_id="photometry", target=self.target, data_product_type="photometry"
+        )
+        photometry_dp.data.save("photometry.txt", ContentFile(b"not a dataframe"))
+        self.client.force_login(User.objects.create_user("user"))
+
+        response = self.client.get(
+            reverse("dataproduct_csv", kwargs={"pk": photometry_dp.id})
+        )
+
+        self.assertEqual(response.status_code, 404)
+        html = Template(
+            "{% load dataproduct_extras_exo %}{% dataframe_csv_downloads target %}"
+        ).render(Context({"target": self.target}))
+        self.assertIn(reverse("dataproduct_csv", kwargs={"pk": dp.id}), html)
+        self.assertNotIn(
+            reverse("dataproduct_csv", kwargs={"pk": photometry_dp.id}), html
+        )
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from astropy.utils import iers
+from django.test import TestCase
+
+from exotom.iers import (
+    configure_iers,
+    update_iers_cache,
+    IERS_A_FILENAME,
+    LEAP_SECONDS_FILENAME,
+)
+
+
+def fake_download_file(url, cache=False, timeout=None):
+    """Returns a copy of astropy's bundled leap seconds, and fails for everything else like without network."""
+    if url != iers.conf.iers_leap_second_auto_url:
+        raise OSError("no network")
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    shutil.copyfile(iers.IERS_LEAP_SECOND_FILE, path)
+    return path
+
+
+class Test(TestCase):
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        iers.conf.reset("system_leap_second_file")
+        self.cache_dir.cleanup()
+
+    def test_configure_without_cache(self):
+        configure_iers(self.cache_dir.name, force=True)
+        self.assertFalse(iers.conf.auto_download)
+        self.assertEqual(iers.conf.iers_degraded_accuracy, "warn")
+
+    @patch("exotom.iers.download_file", fake_download_file)
+    def test_update_keeps_old_files_if_download_fails(self):
+        iers_a_path = os.path.join(self.cache_dir.name, IERS_A_FILENAME)
+        with open(iers_a_path, "w") as f:
+            f.write("old")
+
+        with self.assertLogs("exotom.iers", level="ERROR"):
+            update_iers_cache(self.cache_dir.name)
+
+        with open(iers_a_path) as f:
+            self.assertEqual(f.read(), "old")
+        leap_seconds_path = os.path.join(self.cache_dir.name, LEAP_SECONDS_FILENAME)
+        self.assertEqual(iers.conf.system_leap_second_file, leap_seconds_path)
+        self.assertEqual(
+            sorted(os.listdir(self.cache_dir.name)),
+            sorted([IERS_A_FILENAME, LEAP_SECONDS_FILENAME]),
+        )
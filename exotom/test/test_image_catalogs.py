@@ -0,0 +1,77 @@
+import glob
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from django.test import TestCase
+
+from exotom.image_catalogs import ImageCatalogs, compact_catalog, load_catalog_files
+
+
+class Test(TestCase):
+    def setUp(self) -> None:
+        files = sorted(
+            glob.glob("exotom/test/test_transit_processor_data_long_with_fit/*.csv")
+        )
+        self.files = files
+        self.catalogs = [pd.read_csv(filename) for filename in files]
+
+    def test_frames_are_kept(self):
+        image_catalogs = ImageCatalogs.from_dataframes(self.catalogs)
+
+        self.assertEqual(len(image_catalogs), len(self.catalogs))
+        self.assertEqual(
+            image_catalogs.times, [cat.iloc[0]["time"] for cat in self.catalogs]
+        )
+        for frame, cat in zip(image_catalogs, self.catalogs):
+            np.testing.assert_array_equal(frame["flux"], cat["flux"])
+            np.testing.assert_array_equal(frame["ra"], cat["ra"])
+            np.testing.assert_allclose(frame["fwhm"], cat["fwhm"], rtol=1e-6)
+        self.assertNotIn("Unnamed: 0", image_catalogs.columns)
+        self.assertEqual(image_catalogs.table["dec"].dtype, np.float64)
+        self.assertEqual(image_catalogs.table["fwhm"].dtype, np.float32)
+
+        memory_usage = sum(
+            cat.memory_usage(index=True, deep=True).sum() for cat in self.catalogs
+        )
+        self.assertLess(image_catalogs.memory_usage(), 0.8 * memory_usage)
+
+    def test_select_frames_and_skip_incomplete_frames(self):
+        self.catalogs[1] = self.catalogs[1].drop(columns=["flux"])
+        image_catalogs = ImageCatalogs.from_dataframes(
+            self.catalogs[:4], required_columns=["flux"]
+        )
+        self.assertEqual(len(image_catalogs), 3)
+
+        selected = image_catalogs.select([True, False, True])
+        self.assertEqual(len(selected), 2)
+        np.testing.assert_array_equal(selected[1]["x"], image_catalogs[2]["x"])
+        np.testing.assert_array_equal(
+            selected.frame_index, np.repeat([0, 1], selected.lengths)
+        )
+
+    def test_load_catalog_files_keeps_order(self):
+        catalogs = load_catalog_files(self.files, workers=4)
+
+        self.assertEqual(len(catalogs), len(self.catalogs))
+        for cat, expected in zip(catalogs, self.catalogs):
+            pd.testing.assert_frame_equal(cat, expected)
+
+    def test_load_catalog_files_keeps_types_of_csv_columns(self):
+        catalog = pd.DataFrame(
+            {
+                "ra": [10.0, 10.1],
+                "flag": [np.nan, np.nan],
+                "date": ["2021-02-21T01:00:00", "2021-02-21T01:01:00"],
+            }
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "catalog.csv")
+            catalog.to_csv(path)
+            (loaded,) = load_catalog_files([path])
+
+        self.assertEqual(loaded["flag"].dtype, np.float64)
+        self.assertTrue(loaded["flag"].isna().all())
+        self.assertEqual(loaded["date"].dtype, object)
+        self.assertEqual(compact_catalog(loaded)["flag"].dtype, np.float32)
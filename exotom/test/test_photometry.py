@@ -0,0 +1,174 @@
+import os
+import time
+from unittest import skipUnless
+from unittest.mock import patch
+
+import astropy.units as u
+import numpy as np
+import pandas as pd
+from astropy.coordinates import SkyCoord
+from django.test import TestCase
+
+from exotom.photometry import (
+    TransitLightCurveExtractor,
+    LightCurvesExtractor,
+    StreamingLightCurvesExtractor,
+    RefCatalogMatcher,
+    MAX_SEPARATION_TO_CATALOG_IN_DEG,
+)
+
+
+class Test(TestCase):
+    def setUp(self) -> None:
+        self.rng = np.random.default_rng(42)
+
+    def make_light_curves_df(self, n_frames: int, n_ref_stars: int) -> pd.DataFrame:
+        # common trend, different brightnesses and noise levels
+        trend = 1 + 0.1 * np.sin(np.linspace(0, 3, n_frames))
+        brightness = self.rng.uniform(1e3, 1e5, n_ref_stars)
+        noise = self.rng.uniform(0.001, 0.05, n_ref_stars)
+        fluxes = (
+            trend[:, np.newaxis]
+            * brightness
+            * (1 + noise * self.rng.standard_normal((n_frames, n_ref_stars)))
+        )
+        df = pd.DataFrame(fluxes, columns=list(range(n_ref_stars)))
+        df["target"] = trend * 2e4
+        df.insert(0, "time", 2459000 + np.arange(n_frames) / 1440)
+        return df
+
+    def test_filter_noisy_light_curves_like_column_loop(self):
+        light_curves_df = self.make_light_curves_df(n_frames=1300, n_ref_stars=300)
+        extractor = TransitLightCurveExtractor(light_curves_df, None, None, None, None)
+        ref_star_columns = extractor.get_ref_star_columns(light_curves_df.columns)
+
+        expected = filter_noisy_light_curves_with_column_loop(
+            light_curves_df.copy(), ref_star_columns
+        )
+        filtered = extractor.filter_noisy_light_curves(light_curves_df.copy())
+
+        pd.testing.assert_frame_equal(filtered, expected)
+        self.assertLess(len(filtered.columns), len(light_curves_df.columns))
+
+    @skipUnless(os.environ.get("EXOTOM_BENCHMARKS"), "set EXOTOM_BENCHMARKS to run")
+    def test_filter_noisy_light_curves_benchmark(self):
+        light_curves_df = self.make_light_curves_df(n_frames=1300, n_ref_stars=300)
+        extractor = TransitLightCurveExtractor(light_curves_df, None, None, None, None)
+        ref_star_columns = extractor.get_ref_star_columns(light_curves_df.columns)
+
+        start = time.perf_counter()
+        filter_noisy_light_curves_with_column_loop(
+            light_curves_df.copy(), ref_star_columns
+        )
+        loop_duration = time.perf_counter() - start
+        start = time.perf_counter()
+        extractor.filter_noisy_light_curves(light_curves_df.copy())
+        duration = time.perf_counter() - start
+
+        print(
+            f"Filtering 300 light curves of 1300 frames took {duration:.3f}s, {loop_duration:.3f}s with column loop."
+        )
+
+    def test_extract_light_curves(self):
+        catalogs = [
+            pd.DataFrame(
+                {"id": [2, 0, -1, 1], "flux": [12.0, 10.0, 99.0, 11.0], "time": 1.0}
+            ),
+            # source 1 twice, source 2 missing
+            pd.DataFrame({"id": [1, 0, 1], "flux": [21.0, 20.0, 29.0], "time": 2.0}),
+        ]
+        extractor = LightCurvesExtractor(catalogs, None)
+
+        light_curves = extractor.extract_light_curves(catalogs, [2, 1, 0], "flux")
+
+        expected = pd.DataFrame(
+            [[12.0, 11.0, 10.0], [np.nan, 21.0, 20.0]],
+            index=[1.0, 2.0],
+            columns=[2, 1, 0],
+        )
+        pd.testing.assert_frame_equal(light_curves, expected)
+
+    def test_enforce_each_ref_source_exactly_once_per_image_and_valid_flux(self):
+        catalogs = [
+            pd.DataFrame(
+                {"id": [0, 1, 2, 3, -1], "flux": [10, 11, 12, 13, 99.0], "time": 1.0}
+            ),
+            # source 1 twice, source 2 missing, source 3 without flux
+            pd.DataFrame(
+                {"id": [0, 1, 1, 3], "flux": [20, 21, 21, np.nan], "time": 2.0}
+            ),
+        ]
+        ref_catalog = pd.DataFrame({"id": [0, 1, 2, 3], "flux": [1.0, 2, 3, 4]})
+        extractor = LightCurvesExtractor(catalogs, None)
+
+        (
+            ref_catalog,
+            catalogs,
+        ) = extractor.enforce_each_ref_source_exactly_once_per_image_and_valid_flux(
+            catalogs, ref_catalog, "flux"
+        )
+        self.assertEqual(list(ref_catalog.id), [0])
+
+        with patch.object(LightCurvesExtractor, "get_flux_matrix") as get_flux_matrix:
+            light_curves = extractor.extract_light_curves(catalogs, [0], "flux")
+        get_flux_matrix.assert_not_called()
+        self.assertEqual(list(light_curves[0]), [10, 20])
+
+    def test_ref_catalog_matcher_matches_match_to_catalog_sky(self):
+        # field of 10' around the pole, where ra differences are largest
+        ref_coords = SkyCoord(
+            self.rng.uniform(0, 360, 300) * u.deg,
+            self.rng.uniform(89.85, 90, 300) * u.deg,
+        )
+        offsets = self.rng.uniform(0, 10, 3000) / 3600
+        coords = ref_coords[self.rng.integers(0, 300, 3000)].directional_offset_by(
+            self.rng.uniform(0, 360, 3000) * u.deg, offsets * u.deg
+        )
+
+        ids = RefCatalogMatcher(ref_coords).match(coords.ra.degree, coords.dec.degree)
+
+        expected, separations, _ = coords.match_to_catalog_sky(ref_coords)
+        expected[separations.degree > MAX_SEPARATION_TO_CATALOG_IN_DEG] = -1
+        np.testing.assert_array_equal(ids, expected)
+        self.assertTrue((ids == -1).any() and (ids >= 0).any())
+
+    def test_streaming_extractor_extracts_same_light_curves(self):
+        data_dir = "exotom/test/test_transit_processor_data_short"
+        catalogs = [
+            pd.read_csv(os.path.join(data_dir, filename))
+            for filename in sorted(os.listdir(data_dir))
+        ]
+        target_coord = SkyCoord(340.08462499999996 * u.deg, 69.50373055555555 * u.deg)
+        expected = LightCurvesExtractor(
+            catalogs, target_coord
+        ).get_target_and_ref_stars_light_curves_df()
+
+        extractor = StreamingLightCurvesExtractor(target_coord)
+        for catalog in catalogs:
+            extractor.add_catalog(catalog)
+        light_curves = extractor.get_target_and_ref_stars_light_curves_df()
+
+        pd.testing.assert_frame_equal(light_curves, expected, check_exact=True)
+        self.assertGreater(len(light_curves.columns), 2)
+
+
+def filter_noisy_light_curves_with_column_loop(
+    light_curves_df, ref_star_columns, kappa=0.1
+):
+    """Reference implementation building the relative light curve of one ref star at a time, as done before."""
+    sum_of_reference_lightcurves = light_curves_df[ref_star_columns].sum(axis="columns")
+    relative_light_curves_stddevs = {}
+    for column in ref_star_columns:
+        comparison_lightcurve = light_curves_df[column]
+        normed_comp_lightcurve = comparison_lightcurve / comparison_lightcurve.mean()
+        relative_comp_lightcurve = sum_of_reference_lightcurves / normed_comp_lightcurve
+        relative_light_curves_stddevs[column] = relative_comp_lightcurve.std()
+
+    avg = np.mean(list(relative_light_curves_stddevs.values()))
+    std = np.std(list(relative_light_curves_stddevs.values()))
+    remove_columns = [
+        col
+        for col, col_std in relative_light_curves_stddevs.items()
+        if col_std > avg + kappa * std
+    ]
+    return light_curves_df.drop(columns=remove_columns)
@@ -0,0 +1,50 @@
+from django.test import TestCase
+from unittest.mock import MagicMock, patch
+
+from astropy.time import Time
+
+from exotom.models import Target
+from exotom.planning_run import PlanningRun
+from exotom.transits import update_transit_catalog
+
+
+class Test(TestCase):
+    def setUp(self) -> None:
+        self.test_now = Time("2021-01-18T12:00:00")
+        Time.now = MagicMock(return_value=self.test_now)
+
+        target1_dict = {
+            "name": "HAT-P-36b",
+            "type": "SIDEREAL",
+            "ra": 188.2662755371191,
+            "dec": 44.9153325204756,
+        }
+        target1_extra_fields = {
+            "Depth (mmag)": 19.323865,
+            "Depth (mmag) err": 0.130853,
+            "Duration (hours)": 2.230884,
+            "Duration (hours) err": 0.021004,
+            "Epoch (BJD)": 2458899.476842,
+            "Epoch (BJD) err": 0.000252,
+            "Mag (TESS)": 11.6281,
+            "Period (days)": 1.327352,
+            "Period (days) err": 2.1e-05,
+        }
+        self.target1 = Target(**target1_dict)
+        self.target1.save(extras=target1_extra_fields)
+
+    def test_transits_are_calculated_once(self):
+        planning_run = PlanningRun(n_days=1)
+
+        with patch(
+            "exotom.planning_run.update_transit_catalog",
+            wraps=update_transit_catalog,
+        ) as calculate:
+            transits = planning_run.transits
+            self.assertEqual(planning_run.transits, transits)
+            self.assertEqual(
+                planning_run.transits_by_target(), {self.target1: transits}
+            )
+        calculate.assert_called_once()
+
+        self.assertEqual([transit.number for transit in transits], [252])
@@ -0,0 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import TestCase
+
+from exotom.sites import get_site, get_instrument_site, get_all_sites
+
+
+class Test(TestCase):
+    def test_sites_are_created_once(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            sites = list(executor.map(get_site, ["Göttingen"] * 32))
+        self.assertTrue(all(site is sites[0] for site in sites))
+        self.assertIs(get_all_sites()["Göttingen"], sites[0])
+
+        ephemerides = [site.sun_moon_ephemeris for site in sites]
+        self.assertTrue(all(e is ephemerides[0] for e in ephemerides))
+
+    def test_instrument_site(self):
+        site = get_instrument_site("0M5 SBIG6303E")
+        self.assertIs(get_instrument_site("0M5 SBIG6303E"), site)
+        self.assertAlmostEqual(site.location.lat.degree, 51.560583)
+        self.assertAlmostEqual(
+            site.location.lat.degree, get_site("Göttingen").location.lat.degree
+        )
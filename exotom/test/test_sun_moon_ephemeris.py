@@ -0,0 +1,138 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import tempfile
+
+import numpy as np
+from astroplan import Observer
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+from astropy.time import Time
+from django.test import TestCase
+
+from exotom.sun_moon_ephemeris import SunMoonEphemeris
+
+
+class Test(TestCase):
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.observer = Observer(
+            latitude=51.560583 * u.deg, longitude=9.944333 * u.deg, elevation=201 * u.m
+        )
+        self.times = Time("2021-01-18T12:00:00") + np.linspace(0, 2, 97) * u.day
+
+    def tearDown(self) -> None:
+        self.cache_dir.cleanup()
+
+    def test_interpolation_is_within_max_error(self):
+        max_error_in_deg = 0.01
+        ephemeris = SunMoonEphemeris(
+            self.observer,
+            resolution_in_mins=1,
+            max_error_in_deg=max_error_in_deg,
+            cache_dir=self.cache_dir.name,
+        )
+        coords = self.observer.altaz(self.times, SkyCoord(188.27, 44.92, unit="deg"))
+
+        sun_alt = self.observer.sun_altaz(self.times).alt.degree
+        moon_altaz = self.observer.moon_altaz(self.times)
+        moon_dist = coords.separation(moon_altaz).degree
+
+        np.testing.assert_allclose(
+            ephemeris.sun_alt(self.times), sun_alt, atol=max_error_in_deg
+        )
+        np.testing.assert_allclose(
+            ephemeris.moon_alt(self.times), moon_altaz.alt.degree, atol=max_error_in_deg
+        )
+        np.testing.assert_allclose(
+            ephemeris.moon_separation(self.times, coords),
+            moon_dist,
+            atol=max_error_in_deg,
+        )
+
+    def test_tables_are_reused_from_disk(self):
+        ephemeris = SunMoonEphemeris(
+            self.observer,
+            resolution_in_mins=1,
+            max_error_in_deg=0.01,
+            cache_dir=self.cache_dir.name,
+        )
+        sun_alt = ephemeris.sun_alt(self.times)
+        self.assertEqual(len(os.listdir(self.cache_dir.name)), 3)
+
+        other_ephemeris = SunMoonEphemeris(
+            self.observer,
+            resolution_in_mins=1,
+            max_error_in_deg=0.01,
+            cache_dir=self.cache_dir.name,
+        )
+        other_ephemeris.calculate_table = None
+        np.testing.assert_array_equal(other_ephemeris.sun_alt(self.times), sun_alt)
+
+    def test_night_intervals_contain_all_dark_times(self):
+        ephemeris = SunMoonEphemeris(
+            self.observer,
+            resolution_in_mins=1,
+            max_error_in_deg=0.01,
+            cache_dir=self.cache_dir.name,
+        )
+        times = self.times[0] + np.linspace(0, 2, 5000) * u.day
+        nights = ephemeris.night_intervals(times[0], times[-1])
+
+        jds = times.jd
+        in_night = np.any(
+            (jds[:, None] >= nights[:, 0]) & (jds[:, None] <= nights[:, 1]), axis=1
+        )
+        sun_alt = ephemeris.sun_alt(times)
+        self.assertTrue(np.all(in_night[sun_alt < -12]))
+        self.assertFalse(np.any(in_night[sun_alt > -11]))
+        self.assertEqual(
+            np.sum((nights[:, 1] >= jds[0]) & (nights[:, 0] <= jds[-1])), 2
+        )
+
+    def test_caches_are_bounded(self):
+        ephemeris = SunMoonEphemeris(
+            self.observer,
+            resolution_in_mins=1,
+            max_error_in_deg=0.01,
+            cache_dir=self.cache_dir.name,
+        )
+        ephemeris.MAX_CACHED_TABLES = 2
+        ephemeris.MAX_CACHED_NIGHTS = 2
+
+        for max_sun_alt in [-6, -12, -18]:
+            ephemeris.night_intervals(self.times[0], self.times[-1], max_sun_alt)
+        nights = ephemeris.night_intervals(self.times[0], self.times[-1], -18)
+
+        self.assertEqual(
+            list(ephemeris.nights), [(59232, 59234, -12), (59232, 59234, -18)]
+        )
+        self.assertIs(nights, ephemeris.nights[(59232, 59234, -18)])
+        self.assertEqual(list(ephemeris.tables), [59233, 59234])
+
+    def test_caches_can_be_used_from_threads(self):
+        ephemeris = SunMoonEphemeris(
+            self.observer,
+            resolution_in_mins=1,
+            max_error_in_deg=0.01,
+            cache_dir=self.cache_dir.name,
+        )
+        ephemeris.MAX_CACHED_TABLES = 2
+        ephemeris.MAX_CACHED_NIGHTS = 2
+        starts = [self.times[0] + i * u.day for i in range(4)] * 25
+        expected = {
+            start.jd: ephemeris.night_intervals(start, start + 1 * u.day)
+            for start in starts[:4]
+        }
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(
+                executor.map(
+                    lambda start: ephemeris.night_intervals(start, start + 1 * u.day),
+                    starts,
+                )
+            )
+
+        for start, nights in zip(starts, results):
+            np.testing.assert_array_equal(nights, expected[start.jd])
+        self.assertLessEqual(len(ephemeris.nights), 2)
+        self.assertLessEqual(len(ephemeris.tables), 2)
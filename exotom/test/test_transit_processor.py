@@ -5,7 +5,7 @@ import pandas as pd
 from astropy.time import Time
 
 from django.core.files import File
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from tom_dataproducts.models import DataProductGroup, DataProduct
 from tom_observations.models import ObservationRecord
@@ -13,6 +13,7 @@ from tom_observations.models import ObservationRecord
 from exotom import transit_processor
 from exotom.models import Target, Transit
 from exotom import observation_downloader
+from exotom.dataframe_storage import read_dataframe
 from exotom.transit_processor import TransitProcessor
 from exotom.transits import calculate_transits_during_next_n_days
 
@@ -102,7 +103,7 @@ class Test(TestCase):
         self.assertEqual(len(image_file_dps), 1)
 
         transit_light_curve_dp = transit_best_light_curve_dps[0]
-        light_curves_df = pd.read_csv(transit_light_curve_dp.data.path)
+        light_curves_df = read_dataframe(transit_light_curve_dp.data.path)
         self.assertEqual(light_curves_df.shape[0], len(file_paths))
 
     def test_long_processing_with_fit(self):
@@ -197,5 +198,120 @@ class Test(TestCase):
         self.assertEqual(len(transit_fit_report), 1)
 
         transit_light_curve_dp = transit_best_light_curve_dps[0]
-        light_curves_df = pd.read_csv(transit_light_curve_dp.data.path)
+        light_curves_df = read_dataframe(transit_light_curve_dp.data.path)
         self.assertEqual(light_curves_df.shape[0], len(file_paths))
+
+    @override_settings(STREAMING_CATALOG_INGEST=True)
+    def test_streaming_ingest_without_catalog_dataproducts(self):
+        # given
+        data_dir = "exotom/test/test_transit_processor_data_short"
+        filenames = sorted(os.listdir(data_dir))
+        products = [
+            {
+                "filename": filename.replace(".csv", ".fits.gz"),
+                "url": os.path.join(data_dir, filename),
+                "created": Time(
+                    pd.read_csv(os.path.join(data_dir, filename))["time"][0],
+                    format="jd",
+                ).isot,
+            }
+            for filename in reversed(filenames)
+        ]
+
+        def download(product, downloader, n_attempts=None):
+            with open(product["url"], "rb") as f:
+                return f.read(), product["created"]
+
+        target1 = Target.objects.create(
+            name="test_TOI 1516.01",
+            type="SIDEREAL",
+            ra=340.08462499999996,
+            dec=69.50373055555555,
+        )
+        obs_record = ObservationRecord.objects.create(
+            target=target1,
+            facility="IAGTransit",
+            observation_id=9876,
+            parameters={"transit": 1234},
+        )
+
+        # when
+        downloader = observation_downloader.TransitObservationDownloader(obs_record)
+        with patch.object(
+            observation_downloader.IAGFacility, "archive_headers", return_value={}
+        ), patch.object(
+            downloader,
+            "get_reduced_data_products_and_check_pipeline_finished",
+            return_value=products,
+        ), patch.object(
+            downloader, "attempt_image_catalog_download", side_effect=download
+        ):
+            all_lightcurves_dp = downloader.attempt_create_all_lightcurves_dataproduct()
+
+        # then
+        self.assertEqual(
+            all_lightcurves_dp.product_id,
+            "Target test_TOI 1516.01, transit #1234_light_curve_all",
+        )
+        self.assertEqual(list(DataProduct.objects.all()), [all_lightcurves_dp])
+        self.assertFalse(DataProductGroup.objects.exists())
+
+        light_curves_df = read_dataframe(all_lightcurves_dp.data.path)
+        self.assertEqual(len(light_curves_df), len(filenames))
+        self.assertTrue(light_curves_df["time"].is_monotonic_increasing)
+        self.assertIn("target", light_curves_df.columns)
+
+    def test_failed_download_leaves_no_catalog_dataproduct_without_file(self):
+        # given
+        data_dir = "exotom/test/test_transit_processor_data_short"
+        products = [
+            {
+                "id": i,
+                "filename": filename.replace(".csv", ".fits.gz"),
+                "url": os.path.join(data_dir, filename),
+                "created": "2021-01-18T12:00:00",
+            }
+            for i, filename in enumerate(sorted(os.listdir(data_dir)))
+        ]
+        failing_url = products[1]["url"]
+
+        def download(product, downloader, n_attempts=None):
+            if product["url"] == failing_url:
+                raise Exception("Download failed")
+            with open(product["url"], "rb") as f:
+                return f.read(), product["created"]
+
+        target1 = Target.objects.create(
+            name="test_TOI 1516.01", type="SIDEREAL", ra=340.08, dec=69.50
+        )
+        obs_record = ObservationRecord.objects.create(
+            target=target1,
+            facility="IAGTransit",
+            observation_id=9876,
+            parameters={"transit": 1234},
+        )
+        downloader = observation_downloader.TransitObservationDownloader(obs_record)
+
+        # when
+        with patch.object(
+            observation_downloader.IAGFacility, "archive_headers", return_value={}
+        ), patch.object(
+            downloader,
+            "get_reduced_data_products_and_check_pipeline_finished",
+            return_value=products,
+        ), patch.object(
+            downloader, "attempt_image_catalog_download", side_effect=download
+        ):
+            with self.assertRaises(Exception):
+                downloader.make_photometry_catalog_data_product_group()
+            failing_url = None
+            group = downloader.make_photometry_catalog_data_product_group()
+
+        # then
+        dps = DataProduct.objects.filter(data_product_type="image_photometry_catalog")
+        self.assertEqual(
+            sorted(dps.values_list("product_id", flat=True)),
+            sorted(str(product["id"]) for product in products),
+        )
+        self.assertTrue(all(dp.data for dp in dps))
+        self.assertEqual(group.dataproduct_set.count(), len(products))
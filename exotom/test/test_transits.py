@@ -1,10 +1,27 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
-from unittest.mock import MagicMock
+from django.urls import reverse
+from unittest.mock import MagicMock, patch
 
-from exotom.transits import calculate_transits_during_next_n_days
+from exotom.transits import (
+    calculate_transits_during_next_n_days,
+    calculate_transit_times,
+    calculate_transits_for_targets,
+    intersects_night,
+    update_transit_catalog,
+)
 
-from exotom.models import Target, Transit, TransitObservationDetails
-from astropy.time import Time
+from exotom.models import (
+    Target,
+    TargetEphemeris,
+    Transit,
+    TransitObservationDetails,
+)
+from astroplan import EclipsingSystem
+from astropy.coordinates import SkyCoord, EarthLocation
+from astropy.time import Time, TimeDelta
+import astropy.units as u
+import numpy as np
 import datetime, pytz
 
 
@@ -151,3 +168,399 @@ class Test(TestCase):
                 self.assertEqual(
                     transit_observation_detail.observable, exp_details["observable"]
                 )
+
+    def test_calculate_transit_times_matches_eclipse_loop(self):
+        # hot jupiter, HAT-P-36b and a long period planet
+        ephemerides = [
+            (2458899.476842, 0.4234, 1.2),
+            (2458899.476842, 1.327352, 2.230884),
+            (2458902.718492, 14.617208, 3.588807),
+        ]
+        target_coords = SkyCoord(self.target1.ra * u.deg, self.target1.dec * u.deg)
+        now = Time("2021-01-18T12:00:00")
+
+        for epoch, period, duration in ephemerides:
+            with self.subTest(period=period):
+                expected = calculate_transit_times_with_eclipse_loop(
+                    target_coords, epoch, period, duration, now, n_days=10
+                )
+                numbers, starts, mids, ends = calculate_transit_times(
+                    target_coords,
+                    epoch,
+                    period,
+                    duration,
+                    now,
+                    now + TimeDelta(10 * u.day),
+                )
+
+                self.assertEqual(list(numbers), [e["number"] for e in expected])
+                for key, times in [("start", starts), ("mid", mids), ("end", ends)]:
+                    for time, exp in zip(times, expected):
+                        self.assertLess(abs((time - exp[key]).sec), 1e-6)
+
+    def test_incremental_calculation_keeps_unchanged_transits(self):
+        calculate_transits_during_next_n_days(self.target1, n_days=5)
+        transit_ids = list(Transit.objects.values_list("id", flat=True))
+        details_ids = list(
+            TransitObservationDetails.objects.values_list("id", flat=True)
+        )
+
+        # nothing changed, so nothing is recalculated
+        calculate_transits_during_next_n_days(self.target1, n_days=3)
+        self.assertEqual(
+            list(Transit.objects.values_list("id", flat=True)), transit_ids
+        )
+        self.assertEqual(
+            list(TransitObservationDetails.objects.values_list("id", flat=True)),
+            details_ids,
+        )
+
+        # longer interval only adds new transits
+        calculate_transits_during_next_n_days(self.target1, n_days=10)
+        self.assertEqual(
+            list(Transit.objects.values_list("id", flat=True))[: len(transit_ids)],
+            transit_ids,
+        )
+        self.assertEqual(Transit.objects.count(), 7)
+        self.assertEqual(TransitObservationDetails.objects.count(), 7 * 3)
+
+        # changed ephemeris updates existing transits in place (saving runs target_post_save hook, which
+        # extends transits to the planning horizon of two weeks)
+        transit_ids = list(Transit.objects.values_list("id", flat=True))
+        self.target1.save(extras={"Mag (TESS)": 15.5})
+        self.assertEqual(
+            list(Transit.objects.values_list("id", flat=True))[: len(transit_ids)],
+            transit_ids,
+        )
+        self.assertEqual(Transit.objects.count(), 10)
+        self.assertFalse(
+            TransitObservationDetails.objects.filter(id__in=details_ids).exists()
+        )
+
+        # and removes stale ones
+        self.target1.save(extras={"Period (days)": 1.5})
+        self.assertFalse(Transit.objects.filter(id__in=transit_ids).exists())
+        self.assertEqual(Transit.objects.count(), 9)
+        self.assertEqual(TransitObservationDetails.objects.count(), 9 * 3)
+
+    def test_extending_transits_only_calculates_new_ones(self):
+        calculate_transits_during_next_n_days(self.target1, n_days=5)
+        last_mid = Transit.objects.order_by("mid").last().mid
+
+        with patch(
+            "exotom.transits.calculate_transit_times", wraps=calculate_transit_times
+        ) as calculate:
+            calculate_transits_during_next_n_days(self.target1, n_days=10)
+        start_time = calculate.call_args[0][4]
+        self.assertGreater(start_time, Time(last_mid))
+        self.assertEqual(
+            list(Transit.objects.order_by("number").values_list("number", flat=True)),
+            list(range(252, 259)),
+        )
+
+    def test_transits_before_last_prediction_are_calculated(self):
+        # like target_post_save hook at current time
+        update_transit_catalog([self.target1])
+        self.assertEqual(Transit.objects.order_by("number").first().number, 252)
+
+        # predicting from an earlier time adds the transits before
+        calculate_transits_during_next_n_days(
+            self.target1, n_days=2, start_time=self.test_now - TimeDelta(2 * u.day)
+        )
+        numbers = list(
+            Transit.objects.order_by("number").values_list("number", flat=True)
+        )
+        self.assertEqual(numbers[:3], [250, 251, 252])
+        self.assertEqual(TransitObservationDetails.objects.count(), len(numbers) * 3)
+
+    def test_shorter_prediction_keeps_transits_until_end_of_last_one(self):
+        update_transit_catalog([self.target1])
+        numbers = list(
+            Transit.objects.order_by("number").values_list("number", flat=True)
+        )
+        transit_ids = list(Transit.objects.values_list("id", flat=True))
+
+        # all transits are recalculated, not only the ones of the next day
+        calculate_transits_during_next_n_days(self.target1, n_days=1, incremental=False)
+        self.assertFalse(Transit.objects.filter(id__in=transit_ids).exists())
+        self.assertEqual(
+            list(Transit.objects.order_by("number").values_list("number", flat=True)),
+            numbers,
+        )
+
+    def test_calculate_transits_for_targets_matches_single_targets_for_any_number_of_workers(
+        self,
+    ):
+        target2 = Target(name="WASP-12b", type="SIDEREAL", ra=97.6366, dec=29.6723)
+        target2.save(
+            extras={
+                "Depth (mmag)": 15.0,
+                "Duration (hours)": 3.0,
+                "Epoch (BJD)": 2457010.512173,
+                "Epoch (BJD) err": 0.0001,
+                "Mag (TESS)": 11.0,
+                "Period (days)": 1.0914203,
+                "Period (days) err": 1.4e-07,
+            }
+        )
+
+        def get_transits():
+            return [
+                (t.target_id, t.number, t.start, t.mid, t.end)
+                for t in Transit.objects.order_by("target_id", "number")
+            ]
+
+        def get_details():
+            return [
+                (d.transit.target_id, d.transit.number, d.site, d.observable)
+                for d in TransitObservationDetails.objects.order_by(
+                    "transit__target_id", "transit__number", "site"
+                )
+            ]
+
+        for target in [self.target1, target2]:
+            calculate_transits_during_next_n_days(target, n_days=5, incremental=False)
+        transits, details = get_transits(), get_details()
+
+        for workers in [1, 2]:
+            Transit.objects.all().delete()
+            calculate_transits_for_targets(
+                [self.target1, target2], n_days=5, incremental=False, workers=workers
+            )
+            self.assertEqual(get_transits(), transits)
+            self.assertEqual(get_details(), details)
+
+    def test_transit_queryset_filters_match_transit_methods(self):
+        calculate_transits_during_next_n_days(self.target1, n_days=10)
+
+        for site in ["McDonald", "Sutherland", "Göttingen"]:
+            for flag in [
+                "visible",
+                "observable",
+                "ingress_visible",
+                "ingress_observable",
+                "egress_visible",
+                "egress_observable",
+            ]:
+                method = f"{flag}_at_site"
+                expected = [
+                    transit.id
+                    for transit in Transit.objects.order_by("id")
+                    if getattr(transit, method)(site)
+                ]
+                transits = getattr(Transit.objects.order_by("id"), method)(site)
+                self.assertEqual(list(transits.values_list("id", flat=True)), expected)
+
+    def test_planning_data_is_loaded_with_constant_number_of_queries(self):
+        calculate_transits_during_next_n_days(self.target1, n_days=10)
+        expected = {
+            transit.id: (
+                sorted(transit.facilities),
+                transit.visible("IAGTransit"),
+                transit.observable_at_site("McDonald"),
+                transit.mag,
+                (
+                    sum(td.visible for td in transit.details),
+                    sum(td.observable for td in transit.details),
+                ),
+            )
+            for transit in Transit.objects.all()
+        }
+
+        with self.assertNumQueries(3):
+            transits = list(Transit.objects.with_planning_data())
+            result = {
+                transit.id: (
+                    sorted(transit.facilities),
+                    transit.visible("IAGTransit"),
+                    transit.observable_at_site("McDonald"),
+                    transit.mag,
+                    (transit.n_visible_sites, transit.n_observable_sites),
+                )
+                for transit in transits
+            }
+            transits[0].get_target_extra("Priority Proposal")
+        self.assertEqual(result, expected)
+
+    def test_no_transit_intersects_night_without_nights(self):
+        ephemeris = MagicMock()
+        ephemeris.night_intervals.return_value = np.zeros((0, 2))
+        times = self.test_now + np.arange(6).reshape(2, 3) * u.hour
+
+        self.assertEqual(list(intersects_night(times, ephemeris)), [False, False])
+
+    def test_target_never_visible_from_site(self):
+        target2 = Target(name="far south", type="SIDEREAL", ra=30.0, dec=-70.0)
+        target2.save(
+            extras={
+                "Depth (mmag)": 15.0,
+                "Duration (hours)": 3.0,
+                "Epoch (BJD)": 2458000.1,
+                "Epoch (BJD) err": 0.001,
+                "Mag (TESS)": 9.0,
+                "Period (days)": 0.8,
+                "Period (days) err": 1e-05,
+            }
+        )
+        calculate_transits_during_next_n_days(target2, n_days=10)
+
+        details = TransitObservationDetails.objects.filter(
+            transit__target=target2, site="Göttingen"
+        )
+        self.assertEqual(details.count(), 12)
+        for d in details:
+            self.assertIsNone(d.target_alt_mid)
+            self.assertIsNone(d.moon_dist_mid)
+            self.assertFalse(d.visible or d.ingress_visible or d.egress_visible)
+        self.assertTrue(
+            TransitObservationDetails.objects.filter(
+                transit__target=target2, site="Sutherland", target_alt_mid__isnull=False
+            ).exists()
+        )
+
+    def test_transit_uncertainty_is_queried_once(self):
+        calculate_transits_during_next_n_days(self.target1, n_days=5)
+        transit = Transit.objects.select_related("target").first()
+
+        with self.assertNumQueries(1):
+            transit.get_observing_window()
+            transit.get_ingress_observing_window()
+            transit.get_egress_observing_window()
+            transit.get_observing_margin_in_mins()
+            transit.mid_earliest()
+            transit.mag
+            transit.depth
+        self.assertAlmostEqual(
+            transit.uncertainty_in_days(), (0.01 ** 2 + (252 * 2.1e-05) ** 2) ** 0.5
+        )
+
+    def test_target_ephemeris_follows_extra_fields(self):
+        calculate_transits_during_next_n_days(self.target1, n_days=5)
+        ephemeris = TargetEphemeris.objects.get(target=self.target1)
+        self.assertEqual(ephemeris.period, 1.327352)
+
+        self.target1.save(extras={"Period (days)": 1.5})
+        ephemeris.refresh_from_db()
+        self.assertEqual(ephemeris.period, 1.5)
+        self.assertEqual(ephemeris.mag, 11.6281)
+
+        with self.assertNumQueries(1):
+            df = TargetEphemeris.objects.all().to_dataframe()
+        self.assertEqual(list(df.index), [self.target1.id])
+        self.assertEqual(df.loc[self.target1.id, "period"], 1.5)
+        self.assertAlmostEqual(df.loc[self.target1.id, "ra"], self.target1.ra)
+
+    def test_target_without_errors_magnitude_and_depth(self):
+        target2 = Target(name="WASP-12b", type="SIDEREAL", ra=97.6366, dec=29.6723)
+        target2.save(
+            extras={
+                "Epoch (BJD)": 2456176.66825800,
+                "Period (days)": 1.09142030,
+                "Duration (hours)": 3.0,
+            }
+        )
+
+        calculate_transits_for_targets([self.target1, target2], n_days=5, workers=1)
+
+        transits = Transit.objects.filter(target=target2)
+        self.assertGreater(len(transits), 0)
+        self.assertEqual(transits[0].uncertainty_in_days(), 0)
+        self.assertFalse(
+            TransitObservationDetails.objects.filter(
+                transit__target=target2, observable=True
+            ).exists()
+        )
+        self.assertTrue(
+            TransitObservationDetails.objects.filter(
+                transit__target=self.target1
+            ).exists()
+        )
+
+    def test_target_ephemeris_is_read_without_saving(self):
+        TargetEphemeris.objects.all().delete()
+        target = Target.objects.get(id=self.target1.id)
+
+        ephemeris = TargetEphemeris.for_target(target)
+
+        self.assertEqual(ephemeris.period, 1.327352)
+        self.assertIsNone(ephemeris.pk)
+        self.assertFalse(TargetEphemeris.objects.exists())
+
+    def test_unsaved_target_ephemeris_is_queried_once(self):
+        calculate_transits_during_next_n_days(self.target1, n_days=5)
+        TargetEphemeris.objects.all().delete()
+        transit = Transit.objects.select_related("target").first()
+
+        with self.assertNumQueries(2):
+            transit.mag
+            transit.depth
+            transit.uncertainty_in_days()
+            TargetEphemeris.for_target(transit.target)
+
+    def test_transits_follow_extra_fields_edited_in_target_update_view(self):
+        update_transit_catalog([self.target1])
+        old_mids = list(Transit.objects.order_by("mid").values_list("mid", flat=True))
+
+        # TargetForm saves the extra fields after the target and thereby after the target_post_save hook
+        data = {
+            "name": self.target1.name,
+            "type": self.target1.type,
+            "ra": self.target1.ra,
+            "dec": self.target1.dec,
+            "targetextra_set-TOTAL_FORMS": 0,
+            "targetextra_set-INITIAL_FORMS": 0,
+            "aliases-TOTAL_FORMS": 0,
+            "aliases-INITIAL_FORMS": 0,
+            **self.target1.extra_fields,
+            "Period (days)": 1.5,
+        }
+        self.client.force_login(User.objects.create_superuser("admin"))
+        response = self.client.post(
+            reverse("targets:update", kwargs={"pk": self.target1.id}), data
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(TargetEphemeris.objects.get(target=self.target1).period, 1.5)
+
+        # nightly update recalculates transits
+        update_transit_catalog([Target.objects.get(id=self.target1.id)])
+        mids = [
+            Time(mid)
+            for mid in Transit.objects.order_by("mid").values_list("mid", flat=True)
+        ]
+        self.assertNotEqual(mids[0].datetime, old_mids[0])
+        self.assertAlmostEqual((mids[1] - mids[0]).jd, 1.5, places=3)
+
+
+def calculate_transit_times_with_eclipse_loop(
+    target_coords, epoch, period, duration, now, n_days
+):
+    """Reference implementation finding one eclipse at a time, as transits were calculated before."""
+    earth_center = EarthLocation.from_geocentric(0, 0, 0, unit=u.m)
+    epoch_barycenter = Time(epoch, format="jd", scale="tdb", location=earth_center)
+    period = period * u.day
+    duration = duration * u.hour
+    system = EclipsingSystem(
+        primary_eclipse_time=epoch_barycenter, orbital_period=period, duration=duration
+    )
+
+    transits = []
+    obstime = now
+    while True:
+        eclipse_barycenter = system.next_primary_eclipse_time(obstime)[0]
+        transit_number = int(
+            np.round((eclipse_barycenter.jd - epoch_barycenter.jd) / period.value)
+        )
+        ltt = eclipse_barycenter.light_travel_time(
+            target_coords, kind="barycentric", location=earth_center
+        )
+        eclipse = eclipse_barycenter - ltt
+        if eclipse > now + TimeDelta(n_days * u.day):
+            break
+        start = eclipse - duration / 2
+        end = eclipse + duration / 2
+        if start > now:
+            transits.append(
+                {"number": transit_number, "start": start, "mid": eclipse, "end": end}
+            )
+        obstime = eclipse + TimeDelta(30 * u.minute)
+    return transits
@@ -1,9 +1,9 @@
-import glob, os, tempfile, time
+import glob, logging, os, tempfile
 
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from astropy.coordinates import SkyCoord, EarthLocation
+from astropy.coordinates import SkyCoord
 import astropy.units as u
 from astropy.io import fits
 from astropy.table import Table
@@ -12,12 +12,16 @@ from astropy.time import Time
 from django.core.files import File
 from django.core.files.base import ContentFile
 from tom_dataproducts.models import DataProductGroup, DataProduct
-from tom_targets.models import Target, TargetExtra
+from tom_targets.models import Target
 
-from exotom.models import Transit
+from exotom.dataframe_storage import read_dataframe, save_dataframe
+from exotom.image_catalogs import ImageCatalogs, compact_catalog, load_catalog_files
+from exotom.models import TargetEphemeris, Transit
 from exotom.photometry import TransitLightCurveExtractor, LightCurvesExtractor
 from exotom.tess_transit_fit import FitResult
-from local_settings import COORDS_BY_INSTRUMENT
+from exotom.sites import get_instrument_site
+
+log = logging.getLogger(__name__)
 
 
 class TransitProcessor:
@@ -37,7 +41,7 @@ class TransitProcessor:
                 target__id=self.observation_record.parameters["target_id"],
                 number=self.observation_record.parameters["transit"],
             )
-        except (KeyError):
+        except KeyError:
             try:
                 self.transit: Transit = Transit.objects.get(
                     id=self.observation_record.parameters["transit_id"]
@@ -83,13 +87,7 @@ class TransitProcessor:
         except KeyError:
             # if instrument_type not in parameters, use goettingen camera
             instrument = "0M5 SBIG6303E"
-        lat = COORDS_BY_INSTRUMENT[instrument]["latitude"]
-        lon = COORDS_BY_INSTRUMENT[instrument]["longitude"]
-        height = COORDS_BY_INSTRUMENT[instrument]["elevation"]
-        earth_location = EarthLocation(
-            lat=lat * u.deg, lon=lon * u.deg, height=height * u.m
-        )
-        return earth_location
+        return get_instrument_site(instrument).location
 
     def process(self):
         """Processes the data products in the data group. Creates three DataProducts
@@ -130,7 +128,7 @@ class TransitProcessor:
         )
 
     def extract_all_lightcurves_df(self):
-        df = pd.read_csv(self.all_lightcurves_dataproduct.data.path)
+        df = read_dataframe(self.all_lightcurves_dataproduct.data.path)
         return df
 
     def extract_best_lightcurves_and_fit(self, all_light_curves_df):
@@ -155,7 +153,7 @@ class TransitProcessor:
     def save_lightcurves_and_fit_report_as_dataproducts(
         self, best_light_curve_df, best_fit_result
     ):
-        self.best_light_curves_dp = self.save_dataframe_as_dataproduct_and_csv_file(
+        self.best_light_curves_dp = self.save_dataframe_as_dataproduct_and_file(
             best_light_curve_df,
             product_id=self.light_curve_name + "_best",
             data_product_type="transit_best_light_curves",
@@ -167,7 +165,7 @@ class TransitProcessor:
                 data_product_type="transit_fit_report",
             )
 
-    def save_dataframe_as_dataproduct_and_csv_file(
+    def save_dataframe_as_dataproduct_and_file(
         self, df, product_id, data_product_type
     ) -> DataProduct:
         try:
@@ -181,12 +179,7 @@ class TransitProcessor:
             observation_record=self.observation_record,
             data_product_type=data_product_type,
         )
-        dfile = ContentFile(df.to_csv())
-        dp.data.save(
-            product_id + ".csv",
-            dfile,
-        )
-        dp.save()
+        save_dataframe(dp, df, product_id)
         return dp
 
     def save_fit_report_as_dataproduct_and_txt_file(
@@ -297,11 +290,9 @@ class TransitProcessor:
         ### draw predicted values ###
         # plot horizontal line at predicted depth
         predicted_color = "green"
-        try:
-            depth = self.target.targetextra_set.get(key="Depth (mmag)").float_value
+        depth = TargetEphemeris.for_target(self.target).depth
+        if depth is not None:
             plt.axhline(y=np.power(10, -depth / 1000 / 2.5), color=predicted_color)
-        except TargetExtra.DoesNotExist:
-            pass
 
         try:
             # draw predicted ingress, mid, egress with 1 sigma errors
@@ -362,61 +353,34 @@ class TransitProcessor:
 
     @staticmethod
     def load_data_from_dataproduct_list(dps: [DataProduct], verbose=True):
-        print("Starting data load from dataproduct list")
-        start = time.time()
-        image_catalogs = []
+        log.info("Starting data load from dataproduct list")
         files = sorted([dp.data.path for dp in dps])
-        print(f"Found {len(files)} files.")
-        for i, filename in enumerate(sorted(files), 1):
-            if verbose and i % 100 == 0:
-                print("(%d/%d) Loading %s..." % (i, len(files), filename))
-
-            cat = pd.read_csv(filename)
-            image_catalogs.append(cat)
-        print("Load took %.2fs" % (time.time() - start,))
-        return image_catalogs
+        return load_catalog_files(files, verbose=verbose)
 
     @staticmethod
     def load_data_from_directory_of_csv_catalogs(data_directory, verbose=False) -> []:
-        print("Starting data load from directory of csv catalogs")
-        start = time.time()
-        image_catalogs = []
+        log.info("Starting data load from directory of csv catalogs")
         files = sorted(glob.glob(os.path.join(data_directory, "*.csv")))
-        print(f"Found {len(files)} files.")
-        for i, filename in enumerate(sorted(files), 1):
-            if verbose and i % 100 == 0:
-                print("(%d/%d) Loading %s..." % (i, len(files), filename))
-
-            cat = pd.read_csv(filename)
-            image_catalogs.append(cat)
-        print("Load took %.2fs" % (time.time() - start,))
-        return image_catalogs
+        return load_catalog_files(files, verbose=verbose)
 
     @staticmethod
     def load_data_from_directory_of_compressed_fits(data_directory, verbose=False):
-        print("Starting data load")
-        # load all catalogs
-        start = time.time()
-        image_catalogs = []
+        log.info("Starting data load")
         files = sorted(glob.glob(os.path.join(data_directory, "*.fits.gz")))
-        for i, filename in enumerate(sorted(files), 1):
-            # load data
-            if verbose and i % 50 == 0:
-                print("(%d/%d) Loading %s..." % (i, len(files), filename))
-
-            if i == 100:
-                one_image = fits.open(filename)[0].data
-
-            hdr = fits.getheader(filename, "SCI")
-            cat = Table(fits.getdata(filename, "CAT")).to_pandas()
+        image_catalogs = load_catalog_files(
+            files, TransitProcessor.load_compressed_fits_catalog, verbose=verbose
+        )
+        one_image = fits.getdata(files[99], 0) if len(files) >= 100 else None
+        return image_catalogs, one_image
 
-            # add date-obs
-            cat["time"] = float(Time(hdr["DATE-OBS"]).jd)
+    @staticmethod
+    def load_compressed_fits_catalog(filename) -> pd.DataFrame:
+        hdr = fits.getheader(filename, "SCI")
+        cat = Table(fits.getdata(filename, "CAT")).to_pandas()
 
-            # append
-            image_catalogs.append(cat)
-        print("Load took %.2fs" % (time.time() - start,))
-        return image_catalogs, one_image
+        # add date-obs
+        cat["time"] = float(Time(hdr["DATE-OBS"]).jd)
+        return cat
 
 
 class TransitPhotometryCatalogGroup:
@@ -479,7 +443,7 @@ class TransitPhotometryCatalogGroup:
         return self.save_all_lightcurves_dataproduct_and_file(self.all_light_curves_df)
 
     def extract_all_lightcurves_df(self):
-        image_catalogs: [] = self.load_data_from_dataproduct_list(self.data_products)
+        image_catalogs = self.load_data_from_dataproduct_list(self.data_products)
 
         lce = LightCurvesExtractor(image_catalogs, self.target_coord)
         all_light_curves_df = lce.get_target_and_ref_stars_light_curves_df()
@@ -487,35 +451,40 @@ class TransitPhotometryCatalogGroup:
         return all_light_curves_df
 
     @staticmethod
-    def load_data_from_dataproduct_list(dps: [DataProduct], verbose=True):
-        print("Starting data load from dataproduct list")
-        start = time.time()
-        image_catalogs = []
+    def load_data_from_dataproduct_list(
+        dps: [DataProduct], verbose=True
+    ) -> ImageCatalogs:
+        log.info("Starting data load from dataproduct list")
         files = sorted([dp.data.path for dp in dps])
-        print(f"Found {len(files)} files.")
-        for i, filename in enumerate(sorted(files), 1):
-            if verbose and i % 100 == 0:
-                print("(%d/%d) Loading %s..." % (i, len(files), filename))
-
-            cat = pd.read_csv(filename)
-            image_catalogs.append(cat)
-        print("Load took %.2fs" % (time.time() - start,))
+        # compact right away, so that full catalogs of all frames are never in memory at once
+        image_catalogs = ImageCatalogs.from_dataframes(
+            load_catalog_files(
+                files,
+                lambda filename: compact_catalog(read_dataframe(filename)),
+                verbose=verbose,
+            ),
+            LightCurvesExtractor.REQUIRED_COLUMNS,
+        )
+        log.info("Catalogs use %.1f MB.", image_catalogs.memory_usage() / 1e6)
         return image_catalogs
 
     def save_all_lightcurves_dataproduct_and_file(
         self, all_light_curves_df
     ) -> DataProduct:
-        product_id = self.light_curve_name + "_all"
+        return self.create_all_lightcurves_dataproduct(
+            all_light_curves_df, self.transit_name, self.observation_record
+        )
+
+    @staticmethod
+    def create_all_lightcurves_dataproduct(
+        all_light_curves_df, transit_name, observation_record
+    ) -> DataProduct:
+        product_id = f"{transit_name}_light_curve_all"
         dp = DataProduct.objects.create(
             product_id=product_id,
-            target=self.target,
-            observation_record=self.observation_record,
+            target=observation_record.target,
+            observation_record=observation_record,
             data_product_type="transit_all_light_curves",
         )
-        dfile = ContentFile(all_light_curves_df.to_csv())
-        dp.data.save(
-            product_id + ".csv",
-            dfile,
-        )
-        dp.save()
+        save_dataframe(dp, all_light_curves_df, product_id)
         return dp
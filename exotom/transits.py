@@ -1,241 +1,675 @@
 import datetime
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
 
 import pytz
-from astroplan import EclipsingSystem, Observer
 from astropy.coordinates import SkyCoord, EarthLocation
 from astropy.time import Time, TimeDelta
 import astropy.units as u
+import django
 import numpy as np
-
-from exotom.models import Transit, Target, TransitObservationDetails
+from django.conf import settings
+from django.db import transaction
+
+from exotom.iers import configure_iers
+from exotom.models import (
+    Transit,
+    Target,
+    TargetEphemeris,
+    TransitObservationDetails,
+    TransitPredictionState,
+)
 from exotom.ofi.iagtransit import IAGTransitFacility
 from exotom.settings import SITES
+from exotom.sites import get_site
+from exotom.sun_moon_ephemeris import SunMoonEphemeris
+from local_settings import (
+    OBSERVE_N_SIGMA_AROUND_TRANSIT,
+    BASELINE_LENGTH_FOR_WHOLE_TRANSIT,
+    BASELINE_LENGTH_FOR_TRANSIT_CONTACT,
+)
+
+configure_iers()
 
 
 def calculate_transits_during_next_n_days(
-    target: Target, n_days: int = 10, start_time: datetime.datetime = None
+    target: Target,
+    n_days: int = 10,
+    start_time: datetime.datetime = None,
+    incremental: bool = True,
+):
+    """Predicts the transits of a target with mid-transit during the next n days and their visibility at all sites.
+
+    In incremental mode, the newly predicted transits are compared to the existing ones by transit number, so that
+    only new transits are inserted, changed ones updated and stale ones deleted. If ephemeris and site configuration
+    are unchanged since the last prediction (see get_transit_prediction_fingerprint) and transits have already been
+    predicted for the whole interval, nothing is recalculated at all, otherwise only transits outside of the interval
+    of the last prediction are calculated. If incremental is False, all future transits are deleted and calculated
+    anew. In both cases, transits predicted before for an overlapping, longer interval are calculated as well, so
+    that the predicted interval does not shrink.
+    """
+    calculate_transits_for_targets([target], n_days, start_time, incremental)
+
+
+def update_transit_catalog(
+    targets: [Target] = None, start_time: datetime.datetime = None, workers: int = None
+):
+    """Extends the predicted transits of the given targets (default: all) to settings.TRANSIT_PLANNING_HORIZON_IN_WEEKS.
+
+    Transits are kept between runs, so usually only the transits that have come into the horizon since the last
+    run are calculated.
+    """
+    if targets is None:
+        targets = Target.objects.all()
+    calculate_transits_for_targets(
+        targets,
+        settings.TRANSIT_PLANNING_HORIZON_IN_WEEKS * 7,
+        start_time,
+        workers=workers,
+    )
+
+
+def calculate_transits_for_targets(
+    targets: [Target],
+    n_days: int = 10,
+    start_time: datetime.datetime = None,
+    incremental: bool = True,
+    workers: int = None,
 ):
+    """Predicts the transits of all given targets like calculate_transits_during_next_n_days and writes them to the
+    database at once.
+
+    If workers (defaults to settings.TRANSIT_PLANNING_WORKERS) is larger than one, transit times and visibilities
+    are calculated in a pool of worker processes. Workers only get plain data and return plain arrays, all database
+    access happens in this process. Results do not depend on the number of workers.
+    """
 
     if start_time is not None:
         now = Time(start_time)
     else:
         now = Time.now()
-
-    # remove all future transits
-    Transit.objects.filter(
+    until = now + TimeDelta(n_days * u.day)
+    if workers is None:
+        workers = settings.TRANSIT_PLANNING_WORKERS
+
+    # find targets that need to be calculated
+    targets = list(targets)
+    ephemerides = TargetEphemeris.objects.in_bulk(
+        [target.id for target in targets], field_name="target_id"
+    )
+    predictions = [
+        prepare_transit_prediction(
+            target,
+            now,
+            until,
+            incremental,
+            ephemerides.get(target.id) or TargetEphemeris.for_target(target),
+        )
+        for target in targets
+    ]
+    jobs = [prediction for prediction in predictions if prediction.job is not None]
+
+    # calculate them, results are in the same order as the jobs
+    if workers > 1 and len(jobs) > 1:
+        chunksize = max(1, len(jobs) // (4 * workers))
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=django.setup
+        ) as executor:
+            results = list(
+                executor.map(
+                    calculate_transit_arrays,
+                    [prediction.job for prediction in jobs],
+                    chunksize=chunksize,
+                )
+            )
+    else:
+        results = [calculate_transit_arrays(prediction.job) for prediction in jobs]
+
+    for prediction, arrays in zip(jobs, results):
+        finish_transit_prediction(prediction, arrays)
+    save_transit_predictions(predictions)
+
+
+class TransitPrediction:
+    """Predicted transits of a target and how they differ from the existing ones, written to the database by
+    save_transit_predictions. If anything needs to be calculated, job contains all data required for it.
+    """
+
+    def __init__(self, target: Target, until: datetime.datetime):
+        self.target = target
+        self.until = until
+        self.job = None
+        self.unchanged = False
+        self.existing_transits = {}
+        self.new_transits = []
+        self.changed_transits = []
+        self.stale_transit_ids = []
+        self.details = []
+        self.state = None
+        self.delete_state = False
+
+
+def prepare_transit_prediction(
+    target: Target,
+    now: Time,
+    until: Time,
+    incremental: bool = True,
+    ephemeris: TargetEphemeris = None,
+) -> TransitPrediction:
+    """Checks whether the transits of a target that start after now and have their mid-transit before until need to
+    be calculated and, if so, creates the job for calculate_transit_arrays.
+
+    :param ephemeris: ephemeris of target, queried if not given
+    """
+
+    prediction = TransitPrediction(target, until.datetime.astimezone(pytz.utc))
+    future_transits = Transit.objects.filter(
         target=target, start__gt=now.datetime.astimezone(pytz.utc)
-    ).delete()
+    )
 
     # got epoch and period?
+    if ephemeris is None:
+        ephemeris = TargetEphemeris.for_target(target)
+    if not ephemeris.is_complete:
+        # remove all future transits
+        prediction.stale_transit_ids = list(
+            future_transits.values_list("id", flat=True)
+        )
+        prediction.delete_state = True
+        return prediction
+
+    # anything changed since last prediction?
+    fingerprint = get_transit_prediction_fingerprint(target, ephemeris.extra_fields)
+    state = TransitPredictionState.objects.filter(target=target).first()
+    if state is None:
+        state = TransitPredictionState(target=target)
+    unchanged = incremental and state.fingerprint == fingerprint
+    now_utc = now.datetime.astimezone(pytz.utc)
     if (
-        "Epoch (BJD)" not in target.extra_fields
-        or target.extra_fields["Epoch (BJD)"] is None
-        or "Period (days)" not in target.extra_fields
-        or target.extra_fields["Period (days)"] is None
-        or "Duration (hours)" not in target.extra_fields
-        or target.extra_fields["Duration (hours)"] is None
+        unchanged
+        and state.predicted_from <= now_utc
+        and state.predicted_until >= prediction.until
     ):
-        return
+        return prediction
 
-    # create observers
-    observers = {
-        code: Observer(
-            latitude=site["latitude"] * u.deg,
-            longitude=site["longitude"] * u.deg,
-            elevation=site["elevation"] * u.m,
+    # compare with existing transits or replace them
+    if incremental:
+        prediction.existing_transits = {
+            transit.number: transit for transit in future_transits
+        }
+    else:
+        prediction.stale_transit_ids = list(
+            future_transits.values_list("id", flat=True)
         )
-        for code, site in IAGTransitFacility.SITES.items()
+    prediction.unchanged = unchanged
+
+    # last prediction covers transits with mid-transit from predicted_from until predicted_until
+    start_time, end_time = now, until
+    overlapping = (
+        state.pk is not None
+        and now_utc <= state.predicted_until
+        and prediction.until >= state.predicted_from
+    )
+    if unchanged and overlapping and state.predicted_from <= now_utc:
+        # if nothing has changed, only transits with mid-transit after the last prediction need to be calculated
+        tail_start_time = Time(state.predicted_until) - TimeDelta(
+            ephemeris.duration / 2 * u.hour
+        )
+        if tail_start_time > now:
+            start_time = tail_start_time
+    elif overlapping and state.predicted_until > prediction.until:
+        # calculate until the end of the last prediction as well, so that the covered interval stays contiguous
+        # and, if anything has changed, transits after until are updated instead of deleted as stale
+        end_time = Time(state.predicted_until)
+
+    # remember what transits are based on and for which interval they are predicted
+    if unchanged and overlapping:
+        state.predicted_from = min(state.predicted_from, now_utc)
+    else:
+        state.predicted_from = now_utc
+    state.predicted_until = end_time.datetime.astimezone(pytz.utc)
+    state.fingerprint = fingerprint
+    prediction.state = state
+
+    prediction.job = {
+        "ra": target.ra,
+        "dec": target.dec,
+        "epoch": ephemeris.epoch,
+        # missing errors count as zero timing error
+        "epoch_err": ephemeris.epoch_err or 0.0,
+        "period": ephemeris.period,
+        "period_err": ephemeris.period_err or 0.0,
+        "duration": ephemeris.duration,
+        "mag": ephemeris.mag,
+        "depth": ephemeris.depth,
+        "start_time": start_time,
+        "end_time": end_time,
+        # if nothing has changed, existing transits are still valid
+        "known_numbers": list(prediction.existing_transits) if unchanged else [],
     }
+    return prediction
 
-    # get coordinates
-    target_coords = SkyCoord(target.ra * u.deg, target.dec * u.deg)
 
-    # parse epoch
-    # transit barycentric correction only wrt to earth center, not specific observatory location
-    earth_center = EarthLocation.from_geocentric(0, 0, 0, unit=u.m)
-    epoch_barycenter = Time(
-        target.extra_fields["Epoch (BJD)"],
-        format="jd",
-        scale="tdb",
-        location=earth_center,
-    )
-    period = target.extra_fields["Period (days)"] * u.day
-    duration = target.extra_fields["Duration (hours)"] * u.hour
+def calculate_transit_arrays(job: dict) -> dict:
+    """Calculates transit times and the visibility of transits at all sites for a job of prepare_transit_prediction.
+
+    Only uses the data in the job, so it can run in a worker process.
+
+    :param job: target coordinates, ephemeris and interval to calculate transits for
+    :return: transit numbers, start, mid and end times of transits, whether they are not known yet, and for those
+        the values of the fields of TransitObservationDetails per site
+    """
 
-    # create system
-    system = EclipsingSystem(
-        primary_eclipse_time=epoch_barycenter, orbital_period=period, duration=duration
+    # calculate all transits within interval
+    target_coords = SkyCoord(job["ra"] * u.deg, job["dec"] * u.deg)
+    numbers, starts, mids, ends = calculate_transit_times(
+        target_coords,
+        job["epoch"],
+        job["period"],
+        job["duration"],
+        job["start_time"],
+        job["end_time"],
     )
 
-    # find eclipses within next n days
-    obstime = now
-    while True:
-        # find next eclipse
-        eclipse_barycenter = system.next_primary_eclipse_time(obstime)[0]
-        transit_number = int(
-            np.round((eclipse_barycenter.jd - epoch_barycenter.jd) / period.value)
+    # visibility of new transits
+    new = ~np.isin(numbers, job["known_numbers"])
+    details = {}
+    if new.any():
+        uncertainties = np.sqrt(
+            job["epoch_err"] ** 2 + (numbers[new] * job["period_err"]) ** 2
         )
+        times = get_checkpoint_times(starts[new], mids[new], ends[new], uncertainties)
+        for site in IAGTransitFacility.SITES:
+            details[site] = calculate_visibility(
+                times, target_coords, site, job["mag"], job["depth"]
+            )
+
+    return {
+        "numbers": numbers,
+        "starts": starts,
+        "mids": mids,
+        "ends": ends,
+        "new": new,
+        "details": details,
+    }
 
-        # apply barycentric correction
-        ltt = eclipse_barycenter.light_travel_time(
-            target_coords, kind="barycentric", location=earth_center
-        )
-        eclipse = eclipse_barycenter - ltt
 
-        # too far?
-        if eclipse > now + TimeDelta(n_days * u.day):
-            break
+def finish_transit_prediction(prediction: TransitPrediction, arrays: dict):
+    """Creates new transits, updates changed ones and their details, and finds stale transits from the results of
+    calculate_transit_arrays."""
 
-        # get start and end times
-        start = eclipse - duration / 2
-        end = eclipse + duration / 2
+    existing_transits = prediction.existing_transits
+    transits = []
+    for number, start, mid, end, new in zip(
+        arrays["numbers"],
+        arrays["starts"],
+        arrays["mids"],
+        arrays["ends"],
+        arrays["new"],
+    ):
+        transit = existing_transits.pop(int(number), None)
+        if not new:
+            continue
 
-        # should not have started yet
-        if start > now:
+        if transit is None:
             # create transit
             transit = Transit()
-            transit.target = target
-            transit.number = transit_number
-            transit.start = start.datetime.astimezone(pytz.utc)
-            transit.mid = eclipse.datetime.astimezone(pytz.utc)
-            transit.end = end.datetime.astimezone(pytz.utc)
-            transit.save()
-
-            # loop facilities
-            for site, observer in observers.items():
-                # create transit details
-                details = create_transit_details(transit, observer, target_coords, site)
-
-                # save
-                details.save()
-
-        # next one
-        obstime = eclipse + TimeDelta(30 * u.minute)
-
-
-def create_transit_details(transit: Transit, observer, coords, site):
-    start, mid, end = transit.start, transit.mid, transit.end
-    observing_start, observing_end = transit.get_observing_window()
-
-    (
-        ingress_observing_start,
-        ingress_observing_end,
-    ) = transit.get_ingress_observing_window()
-    egress_observing_start, egress_observing_end = transit.get_egress_observing_window()
-
-    times = [
-        start,
-        mid,
-        end,
-        observing_start,
-        observing_end,
-        ingress_observing_start,
-        ingress_observing_end,
-        egress_observing_start,
-        egress_observing_end,
-    ]
+            transit.target = prediction.target
+            transit.number = int(number)
+            prediction.new_transits.append(transit)
+        else:
+            prediction.changed_transits.append(transit)
+
+        transit.start = start.datetime.astimezone(pytz.utc)
+        transit.mid = mid.datetime.astimezone(pytz.utc)
+        transit.end = end.datetime.astimezone(pytz.utc)
+        transits.append(transit)
+
+    # remove stale transits, all existing transits are still valid if nothing has changed
+    if not prediction.unchanged:
+        prediction.stale_transit_ids.extend(
+            transit.id for transit in existing_transits.values()
+        )
 
-    target_positions = {time: observer.altaz(time, coords) for time in times}
-    sun_positions = {time: observer.sun_altaz(time) for time in times}
+    # create transit details for all new and changed transits and facilities
+    for i, transit in enumerate(transits):
+        for site, fields in arrays["details"].items():
+            details = TransitObservationDetails(
+                transit=transit,
+                facility="IAGTransit",
+                site=site,
+                **{name: values[i] for name, values in fields.items()},
+            )
+            prediction.details.append(details)
+
+
+def save_transit_predictions(predictions: [TransitPrediction]):
+    """Writes predicted transits and their details to the database in a single transaction using bulk queries."""
+
+    stale_transit_ids = [i for p in predictions for i in p.stale_transit_ids]
+    new_transits = [t for p in predictions for t in p.new_transits]
+    changed_transits = [t for p in predictions for t in p.changed_transits]
+    details = [d for p in predictions for d in p.details]
+    states = [p.state for p in predictions if p.state is not None]
+
+    with transaction.atomic():
+        # delete stale transits and outdated details
+        if stale_transit_ids:
+            Transit.objects.filter(id__in=stale_transit_ids).delete()
+        if changed_transits:
+            TransitObservationDetails.objects.filter(
+                transit_id__in=[t.id for t in changed_transits]
+            ).delete()
+        deleted_states = [p.target for p in predictions if p.delete_state]
+        if deleted_states:
+            TransitPredictionState.objects.filter(target__in=deleted_states).delete()
+
+        # write transits, details need their ids
+        Transit.objects.bulk_update(changed_transits, ["start", "mid", "end"])
+        Transit.objects.bulk_create(new_transits)
+        set_missing_transit_ids(new_transits)
+        TransitObservationDetails.objects.bulk_create(details)
+
+        # and prediction states
+        TransitPredictionState.objects.bulk_create(
+            [state for state in states if state.pk is None]
+        )
+        TransitPredictionState.objects.bulk_update(
+            [state for state in states if state.pk is not None],
+            ["fingerprint", "predicted_from", "predicted_until"],
+        )
 
-    # create new TransitObservationDetails object and fill it
-    details = TransitObservationDetails()
-    details.target_alt_mid = target_positions[mid].alt.degree
-    details.target_alt_start = target_positions[start].alt.degree
-    details.target_alt_end = target_positions[end].alt.degree
-    details.sun_alt_mid = sun_positions[mid].alt.degree
-    details.moon_alt_mid = observer.moon_altaz(mid).alt.degree
-    details.moon_dist_mid = (
-        target_positions[mid].separation(observer.moon_altaz(mid)).degree
-    )
 
-    # transit visible (from start to end)
-    transit_high_enough_for_visible = (
-        details.target_alt_start > 30
-        and details.target_alt_mid > 30
-        and details.target_alt_end > 30
+def set_missing_transit_ids(transits: [Transit]):
+    """Sets ids of transits created by bulk_create on databases that do not return them (i.e. all but PostgreSQL)."""
+    missing = [transit for transit in transits if transit.pk is None]
+    if not missing:
+        return
+
+    # past transits may have the same number, if the ephemeris has changed, so match start time as well
+    ids = {
+        (target_id, number, start): id
+        for target_id, number, start, id in Transit.objects.filter(
+            target_id__in={transit.target_id for transit in missing},
+            number__in={transit.number for transit in missing},
+        ).values_list("target_id", "number", "start", "id")
+    }
+    for transit in missing:
+        transit.pk = ids[(transit.target_id, transit.number, transit.start)]
+
+
+def get_transit_prediction_fingerprint(target: Target, extra_fields: dict) -> str:
+    """Returns a hash of everything predicted transits and their visibility depend on, i.e. coordinates and
+    ephemeris of the target, the sites and the observing margins."""
+    data = {
+        "coords": [target.ra, target.dec],
+        "extras": {
+            key: extra_fields.get(key)
+            for key in [
+                "Epoch (BJD)",
+                "Epoch (BJD) err",
+                "Period (days)",
+                "Period (days) err",
+                "Duration (hours)",
+                "Mag (TESS)",
+                "Depth (mmag)",
+            ]
+        },
+        "facility_sites": IAGTransitFacility.SITES,
+        "sites": SITES,
+        "margins": [
+            OBSERVE_N_SIGMA_AROUND_TRANSIT,
+            BASELINE_LENGTH_FOR_WHOLE_TRANSIT,
+            BASELINE_LENGTH_FOR_TRANSIT_CONTACT,
+        ],
+    }
+    return hashlib.sha1(
+        json.dumps(data, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def calculate_transit_times(
+    target_coords: SkyCoord,
+    epoch: float,
+    period: float,
+    duration: float,
+    start_time: Time,
+    end_time: Time,
+) -> (np.ndarray, Time, Time, Time):
+    """Calculates the transits that start after start_time and have their mid-transit before end_time.
+
+    All transit numbers in the interval are calculated at once and the barycentric correction is applied
+    to the whole array of eclipse times, so the cost does not grow with the number of transits.
+
+    :param target_coords: coordinates of target
+    :param epoch: epoch of a mid-transit in BJD (TDB)
+    :param period: orbital period in days
+    :param duration: duration of transit in hours
+    :param start_time: transits must start after this time
+    :param end_time: mid-transits must be before this time
+    :return: transit numbers and start, mid and end times (UTC) of transits
+    """
+
+    # parse epoch
+    # transit barycentric correction only wrt to earth center, not specific observatory location
+    earth_center = EarthLocation.from_geocentric(0, 0, 0, unit=u.m)
+    epoch_barycenter = Time(epoch, format="jd", scale="tdb", location=earth_center)
+    period = period * u.day
+    duration = duration * u.hour
+
+    # transit numbers of first barycentric eclipse after start_time and last one that can still be before
+    # end_time after barycentric correction (which is at most ~8.3 minutes)
+    first_number = np.floor(
+        (start_time - epoch_barycenter).to(u.day).value / period.value
     )
-    sun_low_enough_for_visible = (
-        sun_positions[start].alt.degree < -12
-        and details.sun_alt_mid < -12
-        and sun_positions[end].alt.degree < -12
+    last_number = np.floor(
+        ((end_time - epoch_barycenter).to(u.day).value + 1 / 144) / period.value
+    )
+    numbers = np.arange(first_number + 1, last_number + 1).astype(int)
+    if len(numbers) == 0:
+        no_transits = Time([], format="jd", scale="utc")
+        return numbers, no_transits, no_transits, no_transits
+
+    # add periods in TT, as astroplan's EclipsingSystem does
+    eclipses_barycenter = epoch_barycenter.tt + numbers * period
+
+    # apply barycentric correction
+    ltt = eclipses_barycenter.light_travel_time(
+        target_coords, kind="barycentric", location=earth_center
     )
-    moon_distant_enough_for_visible = details.moon_dist_mid > 30
-    details.visible = (
-        transit_high_enough_for_visible
-        and sun_low_enough_for_visible
-        and moon_distant_enough_for_visible
+    mids = (eclipses_barycenter - ltt).utc
+
+    # get start and end times
+    starts = mids - duration / 2
+    ends = mids + duration / 2
+
+    # should not have started yet and not be too far in the future
+    mask = (starts > start_time) & (mids <= end_time)
+    return numbers[mask], starts[mask], mids[mask], ends[mask]
+
+
+# indices of times in checkpoint array
+(
+    START,
+    MID,
+    END,
+    OBSERVING_START,
+    OBSERVING_END,
+    INGRESS_OBSERVING_START,
+    INGRESS_OBSERVING_END,
+    EGRESS_OBSERVING_START,
+    EGRESS_OBSERVING_END,
+) = range(9)
+
+
+def get_checkpoint_times(
+    starts: Time, mids: Time, ends: Time, uncertainties_in_days: np.ndarray
+) -> Time:
+    """Returns times at which visibility of transits is checked as array of shape (len(starts), 9).
+
+    The observing windows are the same as the ones returned by Transit.get_observing_window and friends.
+    """
+    error = uncertainties_in_days * OBSERVE_N_SIGMA_AROUND_TRANSIT * u.day
+    whole_transit_baseline = BASELINE_LENGTH_FOR_WHOLE_TRANSIT * u.min
+    transit_contact_baseline = BASELINE_LENGTH_FOR_TRANSIT_CONTACT * u.min
+
+    checkpoints = [
+        starts,
+        mids,
+        ends,
+        starts - error - whole_transit_baseline,
+        ends + error + whole_transit_baseline,
+        starts - error - transit_contact_baseline,
+        starts + error + transit_contact_baseline,
+        ends - error - transit_contact_baseline,
+        ends + error + transit_contact_baseline,
+    ]
+    return Time(
+        np.stack([checkpoint.utc.jd1 for checkpoint in checkpoints], axis=1),
+        np.stack([checkpoint.utc.jd2 for checkpoint in checkpoints], axis=1),
+        format="jd",
+        scale="utc",
     )
 
-    # observable = visible with margins (errors + baseline) and telescope constraints
+
+def calculate_visibility(
+    times: Time,
+    coords: SkyCoord,
+    site: str,
+    mag: float,
+    depth: float,
+) -> dict:
+    """Calculates visibility of transits at a site from target and sun altitudes at their checkpoint times.
+
+    Sun and moon positions are interpolated from the site's SunMoonEphemeris, which is shared by all targets.
+    Target positions are only calculated for transits with checkpoints during the night and only if the target
+    culminates high enough at the site, all checkpoints of all those transits are transformed to the site's AltAz
+    frame at once. Other transits are neither visible nor observable, their target altitudes and moon distance
+    are None.
+
+    :return: values of the fields of TransitObservationDetails as lists with one entry per transit
+    """
+    observer = get_site(site).observer
+    ephemeris = get_site(site).sun_moon_ephemeris
+    sun_alts = ephemeris.sun_alt(times)
+    moon_alt_mid = ephemeris.moon_alt(times[:, MID])
+
+    # target positions only for transits with any checkpoint at night, if target gets high enough at all
+    if can_reach_altitude(coords.dec.degree, observer.location.lat.degree, 30):
+        calculate = intersects_night(times, ephemeris)
+    else:
+        calculate = np.zeros(len(times), dtype=bool)
+    target_alts = np.full(times.shape, np.nan)
+    moon_dist_mid = np.full(len(times), np.nan)
+    if calculate.any():
+        target_positions = observer.altaz(times[calculate], coords)
+        target_alts[calculate] = target_positions.alt.degree
+        moon_dist_mid[calculate] = ephemeris.moon_separation(
+            times[calculate, MID], target_positions[:, MID]
+        )
+
+    high_enough = target_alts > 30
+    sun_low_enough = sun_alts < -12
+    moon_distant_enough = moon_dist_mid > 30
+
+    # telescope constraints
     transit_observation_constraints_at_site = SITES[site][
         "transitObservationConstraints"
     ]
+    # not met, if magnitude or depth are unknown
+    telescope_constraints = (
+        mag is not None
+        and depth is not None
+        and mag <= transit_observation_constraints_at_site["maxMagnitude"]
+        and depth >= transit_observation_constraints_at_site["minTransitDepthInMmag"]
+    )
 
-    transit_high_enough_for_observable = (
-        target_positions[observing_start].alt.degree > 30
-        and details.target_alt_mid > 30
-        and target_positions[observing_end].alt.degree > 30
-    )
-    sun_low_enough_for_observable = (
-        sun_positions[observing_start].alt.degree < -12
-        and details.sun_alt_mid < -12
-        and sun_positions[observing_end].alt.degree < -12
-    )
-    moon_distant_enough_for_observable = details.moon_dist_mid > 30
-    details.observable = (
-        # same as visible but with margins = baseline observation time and transit timing errors
-        (
-            transit_high_enough_for_observable
-            and sun_low_enough_for_observable
-            and moon_distant_enough_for_observable
-        )
-        # telescope constraints
-        and transit.mag <= transit_observation_constraints_at_site["maxMagnitude"]
-        and transit.depth
-        >= transit_observation_constraints_at_site["minTransitDepthInMmag"]
+    # transit visible (from start to end)
+    visible = (
+        high_enough[:, START]
+        & high_enough[:, MID]
+        & high_enough[:, END]
+        & sun_low_enough[:, START]
+        & sun_low_enough[:, MID]
+        & sun_low_enough[:, END]
+        & moon_distant_enough
+    )
+
+    # observable = visible with margins (errors + baseline) and telescope constraints
+    observable = (
+        high_enough[:, OBSERVING_START]
+        & high_enough[:, MID]
+        & high_enough[:, OBSERVING_END]
+        & sun_low_enough[:, OBSERVING_START]
+        & sun_low_enough[:, MID]
+        & sun_low_enough[:, OBSERVING_END]
+        & moon_distant_enough
+        & telescope_constraints
     )
 
     # visibility/observability for ingress/egress of transit only
-    # visibility of ingress at start
-    details.ingress_visible = (
-        details.target_alt_start > 30
-        and sun_positions[start].alt.degree < -12
-        and details.moon_dist_mid > 30
-    )
-    details.ingress_observable = (
-        details.ingress_visible
+    ingress_visible = (
+        high_enough[:, START] & sun_low_enough[:, START] & moon_distant_enough
+    )
+    ingress_observable = (
+        ingress_visible
         # check margins = baseline observation time and transit timing errors
-        and target_positions[ingress_observing_start].alt.degree > 30
-        and target_positions[ingress_observing_end].alt.degree > 30
-        and sun_positions[ingress_observing_start].alt.degree < -12
-        and sun_positions[ingress_observing_end].alt.degree < -12
-        # telescope constraints
-        and transit.mag <= transit_observation_constraints_at_site["maxMagnitude"]
-        and transit.depth
-        >= transit_observation_constraints_at_site["minTransitDepthInMmag"]
-    )
-
-    details.egress_visible = (
-        details.target_alt_end
-        and sun_positions[end].alt.degree < -12
-        and details.moon_dist_mid > 30
-    )
-    details.egress_observable = (
-        details.egress_visible
-        and target_positions[egress_observing_start].alt.degree > 30
-        and target_positions[egress_observing_end].alt.degree > 30
-        and sun_positions[egress_observing_start].alt.degree < -12
-        and sun_positions[egress_observing_end].alt.degree < -12
-        and transit.mag <= transit_observation_constraints_at_site["maxMagnitude"]
-        and transit.depth
-        >= transit_observation_constraints_at_site["minTransitDepthInMmag"]
-    )
-
-    # fill details
-    details.transit = transit
-    details.facility = "IAGTransit"
-    details.site = site
-
-    # return it
-    return details
+        & high_enough[:, INGRESS_OBSERVING_START]
+        & high_enough[:, INGRESS_OBSERVING_END]
+        & sun_low_enough[:, INGRESS_OBSERVING_START]
+        & sun_low_enough[:, INGRESS_OBSERVING_END]
+        & telescope_constraints
+    )
+    egress_visible = high_enough[:, END] & sun_low_enough[:, END] & moon_distant_enough
+    egress_observable = (
+        egress_visible
+        & high_enough[:, EGRESS_OBSERVING_START]
+        & high_enough[:, EGRESS_OBSERVING_END]
+        & sun_low_enough[:, EGRESS_OBSERVING_START]
+        & sun_low_enough[:, EGRESS_OBSERVING_END]
+        & telescope_constraints
+    )
+
+    return {
+        "target_alt_start": nan_to_none(target_alts[:, START]),
+        "target_alt_mid": nan_to_none(target_alts[:, MID]),
+        "target_alt_end": nan_to_none(target_alts[:, END]),
+        "sun_alt_mid": sun_alts[:, MID].tolist(),
+        "moon_alt_mid": moon_alt_mid.tolist(),
+        "moon_dist_mid": nan_to_none(moon_dist_mid),
+        "visible": visible.tolist(),
+        "observable": observable.tolist(),
+        "ingress_visible": ingress_visible.tolist(),
+        "ingress_observable": ingress_observable.tolist(),
+        "egress_visible": egress_visible.tolist(),
+        "egress_observable": egress_observable.tolist(),
+    }
+
+
+def can_reach_altitude(dec: float, latitude: float, altitude: float) -> bool:
+    """Checks whether a target with given declination culminates above altitude at a site with given latitude.
+
+    A margin of one degree accounts for precession and refraction, which are ignored here.
+    """
+    return 90 - abs(latitude - dec) > altitude - 1
+
+
+def intersects_night(times: Time, ephemeris: SunMoonEphemeris) -> np.ndarray:
+    """Checks for each row of times, whether the interval spanned by it intersects a night of the ephemeris."""
+    jds = times.utc.jd
+    starts, ends = jds.min(axis=1), jds.max(axis=1)
+    nights = ephemeris.night_intervals(
+        Time(starts.min(), format="jd", scale="utc"),
+        Time(ends.max(), format="jd", scale="utc"),
+    )
+    if len(nights) == 0:
+        return np.zeros(len(starts), bool)
+
+    # first night that ends after start of interval must start before its end
+    i = np.searchsorted(nights[:, 1], starts)
+    return (i < len(nights)) & (nights[np.minimum(i, len(nights) - 1), 0] <= ends)
+
+
+def nan_to_none(values: np.ndarray) -> list:
+    return [None if np.isnan(value) else value for value in values.tolist()]
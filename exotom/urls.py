@@ -13,8 +13,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+
 from django.urls import path, include
-from exotom.views import TransitsView, TransitObservationDetailView
+from exotom.views import (
+    TransitsView,
+    TransitObservationDetailView,
+    DataProductCSVView,
+)
 
 urlpatterns = [
     path("", include("tom_common.urls")),
@@ -24,4 +29,9 @@ urlpatterns = [
         TransitObservationDetailView.as_view(),
         name="transitobservationdetails",
     ),
+    path(
+        "dataproducts/<int:pk>/csv/",
+        DataProductCSVView.as_view(),
+        name="dataproduct_csv",
+    ),
 ]
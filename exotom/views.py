@@ -1,8 +1,18 @@
+import os
 from datetime import timedelta
 
 from astropy.time import Time, TimeDelta
-from django.views.generic import TemplateView
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.generic import TemplateView, View
+from tom_dataproducts.models import DataProduct
 
+from exotom.dataframe_storage import (
+    DATAFRAME_DATA_PRODUCT_TYPES,
+    read_dataframe,
+    dataframe_to_csv,
+)
 from exotom.models import Transit
 
 
@@ -16,11 +26,16 @@ class TransitsView(TemplateView):
         # get now
         now = Time.now()
 
-        # get transits
-        transits = Transit.objects.filter(end__gte=now.datetime)
+        # get transits visible at any site
+        transits = (
+            Transit.objects.filter(end__gte=now.datetime).visible().with_planning_data()
+        )
 
         # sort and return
-        return {"transits": transits.order_by("start")}
+        return {
+            "transits": transits.order_by("start"),
+            "horizon_in_days": settings.TRANSIT_PLANNING_HORIZON_IN_WEEKS * 7,
+        }
 
 
 class TransitObservationDetailView(TemplateView):
@@ -59,3 +74,18 @@ class TransitObservationDetailView(TemplateView):
             "times": times,
             "uncertainty_in_mins": uncertainty_in_mins,
         }
+
+
+class DataProductCSVView(View):
+    """Downloads a data product stored by save_dataframe as CSV, whatever format it is stored in."""
+
+    def get(self, request, *args, **kwargs):
+        dp = get_object_or_404(DataProduct, pk=kwargs["pk"])
+        if dp.data_product_type not in DATAFRAME_DATA_PRODUCT_TYPES:
+            raise Http404("Data product is not stored as DataFrame.")
+        df = read_dataframe(dp.data.path)
+
+        filename = os.path.splitext(os.path.basename(dp.data.name))[0] + ".csv"
+        response = HttpResponse(dataframe_to_csv(df), content_type="text/csv")
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response